@@ -0,0 +1,144 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from offline import OfflineRenderer, load_visualizer
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.aiff', '.aif', '.mp3')
+
+_worker = None  # Состояние визуализатора в процессе-исполнителе
+
+
+def file_checksum(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def collect_inputs(source):
+    # Папка (рекурсивно) или манифест: по одному пути на строку, # — комментарий
+    if os.path.isdir(source):
+        found = []
+        for root, _, files in os.walk(source):
+            found.extend(os.path.join(root, name) for name in files if name.lower().endswith(AUDIO_EXTENSIONS))
+        return source, sorted(found)
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r', encoding='utf-8') as f:
+        paths = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    return base, [p if os.path.isabs(p) else os.path.join(base, p) for p in paths]
+
+
+def output_paths(path, base, output_dir):
+    relative = os.path.splitext(os.path.relpath(os.path.abspath(path), os.path.abspath(base)))[0]
+    if relative.startswith('..'):
+        relative = os.path.splitext(os.path.basename(path))[0]
+    target = os.path.join(output_dir, relative)
+    return target + '.bars.npy', target + '.json'
+
+
+def init_worker(config_file, size):
+    global _worker
+    visualizer = load_visualizer(config_file)
+    visualizer.debug_output = False
+    _worker = OfflineRenderer(visualizer, size)
+
+
+def settings_fingerprint(renderer, frames, fps):
+    v = renderer.visualizer
+    settings = {
+        'chunk': v.CHUNK, 'hop': v.HOP, 'bars': v.current_bars, 'gain': v.GAIN, 'fft_gain': v.FFT_GAIN,
+        'freq_scale': v.freq_scale, 'f_min': v.f_min, 'f_max': v.f_max,
+        'decay_factor': v.decay_factor, 'use_caps': v.use_caps, 'cap_decay_factor': v.cap_decay_factor,
+        'frames': bool(frames), 'fps': fps, 'size': list(renderer.size),
+    }
+    if frames:
+        # Кадры PNG зависят ещё и от настроек отрисовки; списки — как они вернутся из JSON
+        settings.update({
+            'color': list(v.current_color) if v.current_color is not None else None,
+            'border_radius': v.border_radius, 'auto_scale': v.AUTO_SCALE, 'scale': renderer.scale,
+            'min_bar_height': v.MIN_BAR_HEIGHT, 'max_bar_height': v.MAX_BAR_HEIGHT,
+        })
+    return settings
+
+
+def process_file(path, output, meta_path, frames, fps):
+    # Выполняется в процессе-исполнителе; готовые файлы с той же суммой и настройками пропускаются
+    checksum = file_checksum(path)
+    settings = settings_fingerprint(_worker, frames, fps)
+    if os.path.exists(meta_path) and os.path.exists(output):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('sha256') == checksum and meta.get('settings') == settings:
+                return {'path': path, 'status': 'skipped', 'duration': meta.get('duration', 0.0), 'elapsed': 0.0}
+        except (OSError, ValueError):
+            pass
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    frames_dir = os.path.splitext(os.path.splitext(output)[0])[0] + '_frames' if frames else None
+    result = _worker.render(path, output, frames_dir, fps)
+    meta = {'source': path, 'sha256': checksum, 'settings': settings,
+            'frames': result['frames'], 'duration': result['duration']}
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=4)
+    return {'path': path, 'status': 'done', 'duration': result['duration'], 'elapsed': result['elapsed']}
+
+
+def run_batch(source, output_dir, workers=None, config_file=None, frames=False, fps=None, size=(800, 600)):
+    base, inputs = collect_inputs(source)
+    started = time.perf_counter()
+    done = skipped = failed = 0
+    audio_seconds = 0.0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(config_file, size)) as pool:
+        futures = {}
+        for path in inputs:
+            output, meta_path = output_paths(path, base, output_dir)
+            futures[pool.submit(process_file, path, output, meta_path, frames, fps)] = path
+        for index, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{index}/{len(inputs)}] {path}: ошибка: {e}")
+                continue
+            if result['status'] == 'skipped':
+                skipped += 1
+            else:
+                done += 1
+                audio_seconds += result['duration']
+            print(f"[{index}/{len(inputs)}] {path}: {result['status']}")
+    elapsed = time.perf_counter() - started
+    summary = {
+        'files': len(inputs), 'done': done, 'skipped': skipped, 'failed': failed, 'elapsed': elapsed,
+        'files_per_second': done / elapsed if elapsed else 0.0,
+        'audio_seconds_per_second': audio_seconds / elapsed if elapsed else 0.0,
+    }
+    print(f"Готово: {done}, пропущено: {skipped}, ошибок: {failed} за {elapsed:.1f} с; "
+          f"{summary['files_per_second']:.2f} файлов/с, {summary['audio_seconds_per_second']:.0f} с звука/с")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная обработка аудиофайлов на нескольких процессах")
+    parser.add_argument("source", help="Папка с аудиофайлами или манифест (путь на строку)")
+    parser.add_argument("-o", "--output", default="previews", help="Папка для результатов")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Количество процессов (по умолчанию все ядра)")
+    parser.add_argument("--frames", action="store_true", help="Также сохранять PNG-кадры")
+    parser.add_argument("--fps", type=float, help="Частота PNG-кадров")
+    parser.add_argument("--size", default="800x600", help="Размер PNG-кадров, например 1920x1080")
+    parser.add_argument("--config", help="Путь к config.json")
+    args = parser.parse_args()
+
+    size = tuple(int(x) for x in args.size.lower().split("x"))
+    summary = run_batch(args.source, args.output, args.workers, args.config, args.frames, args.fps, size)
+    if summary['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
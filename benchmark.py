@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Без окна: замер отрисовки в памяти
+
+import numpy as np
+import pygame
+
+BARS = (10, 50, 100)
+CHUNKS = (1024, 2048, 4096)
+SIZES = ((800, 600), (1920, 1080), (3840, 2160))
+SIGNALS = ("sweep", "noise", "silence")
+METRICS = ("p50_us", "p95_us")  # По этим значениям сравнивается базовая линия
+
+
+def synthetic_signal(kind, rate, seconds=2.0, seed=0):
+    t = np.arange(int(rate * seconds)) / rate
+    if kind == "sweep":
+        # Логарифмический свип 20 Гц – 20 кГц
+        f0, f1 = 20.0, min(20000.0, rate / 2)
+        k = np.log(f1 / f0) / seconds
+        return (0.5 * np.sin(2 * np.pi * f0 * (np.exp(k * t) - 1) / k)).astype(np.float32)
+    if kind == "noise":
+        return (0.3 * np.random.default_rng(seed).standard_normal(len(t))).astype(np.float32)
+    if kind == "silence":
+        return np.zeros(len(t), dtype=np.float32)
+    raise ValueError(f"Неизвестный сигнал: {kind}")
+
+
+def windows(signal, size, hop):
+    count = max(1, (len(signal) - size) // hop + 1)
+    return [signal[i * hop:i * hop + size] for i in range(count)]
+
+
+def summarize(times_ns, alloc_bytes, retained_blocks):
+    us = np.asarray(times_ns) / 1000.0
+    return {
+        'frames': len(us),
+        'mean_us': float(us.mean()),
+        'p50_us': float(np.percentile(us, 50)),
+        'p95_us': float(np.percentile(us, 95)),
+        'p99_us': float(np.percentile(us, 99)),
+        'max_us': float(us.max()),
+        'alloc_bytes_per_frame': alloc_bytes,
+        'retained_blocks_per_frame': retained_blocks,
+    }
+
+
+def measure(step, frames, warmup=10):
+    # Время кадра замеряется без tracemalloc; память — отдельным проходом: пик временных выделений
+    # за кадр в байтах и прирост числа живых блоков (оставшиеся после кадра объекты, а не все выделения)
+    for i in range(warmup):
+        step(i)
+    times = []
+    for i in range(frames):
+        start = time.perf_counter_ns()
+        step(i)
+        times.append(time.perf_counter_ns() - start)
+
+    sample = min(frames, 50)
+    tracemalloc.start()
+    peak_total = 0
+    blocks_before = sys.getallocatedblocks()
+    for i in range(sample):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        step(i)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - base
+    retained = (sys.getallocatedblocks() - blocks_before) / sample
+    tracemalloc.stop()
+    return summarize(times, peak_total / sample, retained)
+
+
+def bench_analysis(visualizer, frames):
+    results = {}
+    for chunk in CHUNKS:
+        for bars in BARS:
+            for kind in SIGNALS:
+                visualizer.CHUNK = chunk
+                visualizer.current_bars = bars
+                visualizer.spectrum = None
+                spectrum = visualizer.get_spectrum()
+                signal = synthetic_signal(kind, visualizer.RATE)
+                blocks = windows(signal, spectrum.fft_size, visualizer.HOP)
+                name = f"analyze/{visualizer.freq_scale}/chunk={chunk}/bars={bars}/{kind}"
+                results[name] = measure(lambda i: visualizer.analyze_audio(blocks[i % len(blocks)]), frames)
+                print(f"{name}: {results[name]['p50_us']:.1f} мкс (p95 {results[name]['p95_us']:.1f})")
+    return results
+
+
+def bench_render(visualizer, frames):
+    results = {}
+    info = pygame.display.Info()
+    sizes = list(SIZES) + [("borderless", (info.current_w, info.current_h))]
+    visualizer.CHUNK = 2048
+    signal = synthetic_signal("noise", visualizer.RATE)
+    for size in sizes:
+        borderless = isinstance(size[0], str)
+        label, (w, h) = (size[0], size[1]) if borderless else (f"{size[0]}x{size[1]}", size)
+        visualizer.screen = pygame.display.set_mode((w, h), pygame.NOFRAME if borderless else 0)
+        for bars in BARS:
+            visualizer.current_bars = bars
+            visualizer.spectrum = None
+            spectrum = visualizer.get_spectrum()
+            blocks = windows(signal, spectrum.fft_size, visualizer.HOP)
+            bar_frames = [visualizer.analyze_audio(b).copy() for b in blocks]
+            for caps in (False, True):
+                for color in ((0, 255, 255), None):
+                    for radius in (0, 14):
+                        visualizer.use_caps = caps
+                        visualizer.current_color = color
+                        visualizer.border_radius = radius
+                        visualizer.renderer = None
+                        name = (f"visualize/{label}/bars={bars}/caps={int(caps)}/"
+                                f"{'rainbow' if color is None else 'solid'}/radius={radius}")
+                        results[name] = measure(lambda i: visualizer.visualize(bar_frames[i % len(bar_frames)]),
+                                                frames)
+                        print(f"{name}: {results[name]['p50_us']:.1f} мкс (p95 {results[name]['p95_us']:.1f})")
+            for mode in ("spectrogram", "waterfall"):
+                visualizer.visual_mode = mode
+                visualizer.renderer = None
+                name = f"visualize/{label}/bars={bars}/{mode}"
+                results[name] = measure(lambda i: visualizer.visualize(bar_frames[i % len(bar_frames)]), frames)
+                print(f"{name}: {results[name]['p50_us']:.1f} мкс (p95 {results[name]['p95_us']:.1f})")
+            visualizer.visual_mode = "bars"
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Регрессия: метрика хуже базовой больше чем на tolerance (доля)
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if not reference:
+            continue
+        for metric in METRICS:
+            if reference[metric] > 0 and current[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {reference[metric]:.1f} -> {current[metric]:.1f} мкс")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер производительности анализа и отрисовки")
+    parser.add_argument("--frames", type=int, default=200, help="Кадров на каждый случай")
+    parser.add_argument("--only", choices=("analyze", "visualize"), help="Запустить только одну часть")
+    parser.add_argument("--scale", help="Шкала частот для анализа (linear, log, mel, octave)")
+    parser.add_argument("-o", "--output", help="Записать результаты в JSON")
+    parser.add_argument("--save-baseline", help="Сохранить результаты как базовую линию")
+    parser.add_argument("--baseline", help="Сравнить с базовой линией и завершиться с ошибкой при регрессии")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Допустимое ухудшение (доля, 0.25 = 25%%)")
+    args = parser.parse_args()
+
+    from main import AudioVisualizer
+    visualizer = AudioVisualizer()
+    visualizer.init_display()
+    visualizer.debug_output = False
+    visualizer.AUTO_SCALE = False
+    if args.scale:
+        visualizer.freq_scale = args.scale
+
+    results = {}
+    try:
+        if args.only != "visualize":
+            results.update(bench_analysis(visualizer, args.frames))
+        if args.only != "analyze":
+            results.update(bench_render(visualizer, args.frames))
+    finally:
+        pygame.quit()
+
+    report = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'processor': platform.processor(), 'numpy': np.__version__, 'pygame': pygame.version.ver},
+        'frames': args.frames,
+        'results': results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=4)
+            print(f"Результаты записаны в {path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Регрессии производительности:")
+            for line in regressions:
+                print(f"  {line}")
+            raise SystemExit(1)
+        print("Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
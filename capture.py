@@ -0,0 +1,215 @@
+import time
+
+import numpy as np
+
+
+class RingBuffer:
+    # Кольцевой буфер фиксированного размера: один писатель (callback звука),
+    # один читатель (цикл визуализации). Писатель сначала копирует данные,
+    # затем сдвигает счётчик записанных сэмплов, поэтому читатель без блокировок
+    # видит только завершённые блоки. Старые данные перезаписываются.
+    # Для нескольких каналов буфер двумерный: (ёмкость, каналы).
+    def __init__(self, capacity, dtype=np.float32, channels=1):
+        self.capacity = int(capacity)
+        self.channels = channels
+        shape = (self.capacity,) if channels == 1 else (self.capacity, channels)
+        self.buffer = np.zeros(shape, dtype=dtype)
+        self.written = 0  # Всего записано сэмплов
+        self.last_write_time = None  # time.perf_counter() последней записи
+        self.overruns = 0  # Сколько раз читатель был перезаписан во время копирования
+
+    def reset(self):
+        self.buffer.fill(0)
+        self.written = 0
+        self.last_write_time = None
+
+    def write(self, block):
+        n = len(block)
+        if n >= self.capacity:
+            block = block[-self.capacity:]
+            n = self.capacity
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = block[:first]
+        if first < n:
+            self.buffer[:n - first] = block[first:]
+        self.last_write_time = time.perf_counter()
+        self.written += n
+
+    def read_latest(self, out, end=None):
+        # Копирует последние len(out) сэмплов (до позиции end) в out, возвращает позицию конца
+        n = len(out)
+        if n > self.capacity:
+            raise ValueError(f"Окно {n} больше ёмкости буфера {self.capacity}")
+        for _ in range(2):
+            stop = self.written if end is None else end
+            if stop < n:
+                out[:n - stop] = 0
+                self._copy(out[n - stop:], 0, stop)
+            else:
+                self._copy(out, stop - n, stop)
+            if self.written - (stop - n) <= self.capacity:
+                return stop
+            self.overruns += 1  # Данные перезаписаны во время чтения, читаем заново
+            end = None
+        return stop
+
+    def _copy(self, out, begin, stop):
+        n = stop - begin
+        if n <= 0:
+            return
+        start = begin % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if first < n:
+            out[first:n] = self.buffer[:n - first]
+
+    def age(self):
+        # Возраст последних записанных данных в секундах
+        if self.last_write_time is None:
+            return 0.0
+        return time.perf_counter() - self.last_write_time
+
+
+class FrameReader:
+    # Выдаёт перекрывающиеся окна размера window с шагом hop из кольцевого буфера.
+    # Если читатель отстал больше чем на шаг, он перескакивает к последним данным.
+    def __init__(self, ring, window, hop):
+        self.ring = ring
+        self.window = int(window)
+        self.hop = max(1, int(hop))
+        self.frame = np.zeros((self.window,) + ring.buffer.shape[1:], dtype=ring.buffer.dtype)
+        self.position = 0  # Конец последнего выданного окна
+        self.dropped = 0  # Пропущено сэмплов из-за отставания
+
+    def resize(self, window):
+        # Смена длины окна (например, при переключении шкалы частот)
+        if window != self.window:
+            self.window = int(window)
+            self.frame = np.zeros((self.window,) + self.ring.buffer.shape[1:], dtype=self.ring.buffer.dtype)
+
+    @property
+    def overlap(self):
+        return max(0.0, 1 - self.hop / self.window)
+
+    def pending(self):
+        return self.ring.written - self.position
+
+    def ready(self):
+        return self.pending() >= self.hop
+
+    def read(self, force=False):
+        # Возвращает последнее окно или None, если новых данных меньше шага
+        pending = self.pending()
+        if pending < self.hop and not force:
+            return None
+        if pending > self.hop:
+            self.dropped += pending - self.hop
+        self.position = self.ring.read_latest(self.frame)
+        return self.frame
+
+
+class MultiFrameReader:
+    # Выравнивание нескольких устройств: когда у первого устройства готов новый шаг,
+    # у всех берутся последние window сэмплов, каналы складываются в одно окно (window x каналы)
+    def __init__(self, readers):
+        self.readers = readers
+        self.channels = [r.ring.channels for r in readers]
+        self.frame = None
+        self.resize(readers[0].window)
+
+    @property
+    def window(self):
+        return self.readers[0].window
+
+    @property
+    def hop(self):
+        return self.readers[0].hop
+
+    @property
+    def overlap(self):
+        return self.readers[0].overlap
+
+    @property
+    def dropped(self):
+        return self.readers[0].dropped
+
+    def resize(self, window):
+        for reader in self.readers:
+            reader.resize(window)
+        if self.frame is None or len(self.frame) != window:
+            self.frame = np.zeros((window, sum(self.channels)), dtype=self.readers[0].frame.dtype)
+
+    def pending(self):
+        return self.readers[0].pending()
+
+    def ready(self):
+        return self.readers[0].ready()
+
+    def read(self):
+        if not self.readers[0].ready():
+            return None
+        column = 0
+        for reader, channels in zip(self.readers, self.channels):
+            data = reader.read(force=True)
+            self.frame[:, column:column + channels] = data.reshape(len(data), -1)
+            column += channels
+        return self.frame
+
+
+# Режимы каналов: сколько каналов открыть на устройстве и как получить из них источники
+CHANNEL_MODES = ("mono", "stereo", "mid_side", "devices")
+
+
+def device_channels(mode):
+    return 2 if mode in ("stereo", "mid_side") else 1
+
+
+def source_matrix(mode, channels):
+    # Матрица смешивания (источники x каналы): источники = M @ каналы
+    if mode == "mid_side":
+        return np.array([[0.5, 0.5], [0.5, -0.5]], dtype=np.float32)
+    return np.eye(channels, dtype=np.float32)
+
+
+class SourceMixer:
+    # Перевод окна (window x каналы) в источники (источники x window) одним умножением матриц
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.out = None
+
+    @property
+    def sources(self):
+        return len(self.matrix)
+
+    def mix(self, frame):
+        shape = (len(self.matrix), len(frame))
+        if self.out is None or self.out.shape != shape:
+            self.out = np.zeros(shape, dtype=frame.dtype)
+        np.matmul(self.matrix, frame.T, out=self.out)
+        return self.out
+
+
+class LatencyMeter:
+    # Оценка задержки от поступления звука до кадра:
+    # задержка входа устройства + накопление блока + возраст данных в буфере
+    def __init__(self, rate, block, device_latency=0.0):
+        self.rate = rate
+        self.block_latency = block / rate
+        self.device_latency = device_latency
+        self.current = 0.0
+        self.average = 0.0
+        self.maximum = 0.0
+        self.samples = 0
+
+    @property
+    def bound(self):
+        # Верхняя граница без учёта отрисовки: устройство + один блок + один шаг ожидания
+        return self.device_latency + 2 * self.block_latency
+
+    def update(self, age):
+        self.current = self.device_latency + self.block_latency + age
+        self.samples += 1
+        self.average += (self.current - self.average) / self.samples
+        self.maximum = max(self.maximum, self.current)
+        return self.current
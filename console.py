@@ -0,0 +1,104 @@
+import collections
+import time
+
+
+class LogSink:
+    # Журнал для консоли GUI. log() можно вызывать из любого потока: строка без блокировок
+    # попадает в кольцо фиксированной ёмкости (при переполнении вытесняются старые), к Tk
+    # не обращается. Повтор той же строки в течение repeat_window только увеличивает
+    # счётчик, общий поток ограничен max_rate строками в секунду. Вывод — пачкой в flush()
+    # из одного потока: в tk.Text (attach, по root.after) или в наследнике через output.
+    def __init__(self, capacity=1000, repeat_window=5.0, max_rate=20.0, interval=0.1):
+        self.lines = collections.deque(maxlen=capacity)
+        self.repeat_window = repeat_window
+        self.max_rate = max_rate
+        self.interval = interval
+        self.dropped = 0  # Вытеснено из кольца или отброшено ограничением частоты
+        self.output = None  # Получатель пачки строк; без него строки ждут в кольце
+        self.widget = None
+        self.max_lines = 0
+        self._recent = {}  # Текст -> [время вывода, подавлено повторов]
+        self._tokens = max_rate
+        self._refilled = time.monotonic()
+        self._flushed = 0.0
+
+    def log(self, text):
+        text = text.rstrip("\n")
+        if not text:
+            return
+        now = time.monotonic()
+        # Повтором считается только тот же текст целиком: сообщения с разными числами
+        # (шаги качества, размеры окна) различны и выводятся каждое
+        entry = self._recent.get(text)
+        if entry is not None and now - entry[0] < self.repeat_window:
+            entry[1] += 1
+            return
+        self._tokens = min(self.max_rate, self._tokens + (now - self._refilled) * self.max_rate)
+        self._refilled = now
+        if self._tokens < 1.0:
+            self.dropped += 1
+            return
+        self._tokens -= 1.0
+        if entry is not None and entry[1]:
+            self._append(self._repeated(text, entry[1]))
+        self._recent[text] = [now, 0]
+        self._append(text)
+
+    def _append(self, text):
+        if len(self.lines) == self.lines.maxlen:
+            self.dropped += 1
+        self.lines.append(text)
+
+    @staticmethod
+    def _repeated(text, count):
+        return f"{text} (повторено ещё {count} раз)"
+
+    def drain(self):
+        # Накопленные строки и итоги подавленных повторов с истёкшим окном
+        lines = []
+        while True:
+            try:
+                lines.append(self.lines.popleft())
+            except IndexError:
+                break
+        now = time.monotonic()
+        for text, entry in list(self._recent.items()):
+            if now - entry[0] >= self.repeat_window:
+                if entry[1]:
+                    lines.append(self._repeated(text, entry[1]))
+                self._recent.pop(text, None)
+        if self.dropped:
+            lines.append(f"Пропущено сообщений: {self.dropped}")
+            self.dropped = 0
+        return lines
+
+    def flush(self, force=False):
+        # Не чаще interval, если не force; вызывается часто, поэтому в обычном случае ничего не делает
+        now = time.monotonic()
+        if self.output is None or (not force and now - self._flushed < self.interval):
+            return
+        self._flushed = now
+        lines = self.drain()
+        if lines:
+            self.output(lines)
+
+    def attach(self, widget, root, max_lines=500):
+        # Вывод в tk.Text из потока Tk; виджет хранит не больше max_lines строк
+        self.widget = widget
+        self.max_lines = max_lines
+        self.output = self._write_widget
+        delay = int(self.interval * 1000)
+
+        def pump():
+            self.flush(force=True)
+            root.after(delay, pump)
+
+        pump()
+
+    def _write_widget(self, lines):
+        widget = self.widget
+        widget.insert("end", "\n".join(lines) + "\n")
+        excess = int(widget.index("end-1c").split(".")[0]) - 1 - self.max_lines
+        if excess > 0:
+            widget.delete("1.0", f"{excess + 1}.0")
+        widget.see("end")
@@ -0,0 +1,364 @@
+import argparse
+import collections
+import os
+import socket
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# Кадр: заголовок + float32 амплитуды (источники x бары) + float32 крышки (если есть флаг FLAG_CAPS)
+MAGIC = b"AVSF"
+VERSION = 1
+FLAG_CAPS = 1
+HEADER = struct.Struct("<4sBBHIdHH")  # magic, версия, флаги, источники, номер, время (unix), бары, резерв
+SEQ_OFFSET = 8  # Смещение номера кадра в заголовке
+
+# Кольцо в разделяемой памяти: заголовок + slots слотов по slot_size байт
+RING_MAGIC = b"AVSR"
+RING_HEADER = struct.Struct("<4sHHII")  # magic, версия, резерв, слоты, размер слота
+RING_HEADER_SIZE = 32  # Счётчик кадров (uint64) лежит по смещению 16
+
+MAX_DATAGRAM = 60000  # Предел размера пачки кадров в одной датаграмме
+
+Frame = collections.namedtuple("Frame", "seq timestamp magnitudes cap_heights size")
+
+
+def frame_size(sources, bars, caps=True):
+    return HEADER.size + 4 * sources * bars * (2 if caps else 1)
+
+
+def encode_frame(buffer, offset, seq, timestamp, magnitudes, cap_heights=None):
+    # Запись кадра прямо в буфер (bytearray, memoryview, разделяемая память) без промежуточных объектов.
+    # Данные пишутся раньше заголовка: читатель кольца видит номер только у полностью записанного кадра.
+    shape = (1,) + magnitudes.shape if magnitudes.ndim == 1 else magnitudes.shape
+    sources, bars = shape
+    planes = 1 if cap_heights is None else 2
+    data = np.ndarray((planes, sources, bars), np.float32, buffer, offset + HEADER.size)
+    data[0] = magnitudes.reshape(shape)
+    if cap_heights is not None:
+        data[1] = cap_heights.reshape(shape)
+    flags = FLAG_CAPS if cap_heights is not None else 0
+    HEADER.pack_into(buffer, offset, MAGIC, VERSION, flags, sources, seq & 0xFFFFFFFF, timestamp, bars, 0)
+    return HEADER.size + data.nbytes
+
+
+def decode_frame(buffer, offset=0):
+    # Кадр из буфера; амплитуды и крышки — представления буфера без копирования
+    magic, version, flags, sources, seq, timestamp, bars, _ = HEADER.unpack_from(buffer, offset)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Неизвестный формат кадра")
+    planes = 2 if flags & FLAG_CAPS else 1
+    data = np.frombuffer(buffer, np.float32, planes * sources * bars, offset + HEADER.size)
+    data = data.reshape(planes, sources, bars)
+    if sources == 1:
+        data = data[:, 0]
+    return Frame(seq, timestamp, data[0], data[1] if planes == 2 else None, HEADER.size + data.nbytes)
+
+
+def parse_address(address):
+    # udp://host:port, host:port или unix:///path/to/socket
+    if address.startswith("unix://"):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix-сокеты недоступны на этой платформе")
+        return socket.AF_UNIX, address[len("unix://"):]
+    if address.startswith("udp://"):
+        address = address[len("udp://"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _attach(name):
+    # Читатель не должен удалять чужое кольцо при выходе: до Python 3.13 подключение
+    # регистрирует память в resource_tracker, как будто процесс её создал
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class FeedRing:
+    # Кольцо кадров в разделяемой памяти. Писатель кодирует кадр прямо в слот seq % slots и после
+    # этого увеличивает счётчик; читатели следуют за счётчиком и читают слоты без копирования.
+    def __init__(self, name, slots=None, slot_size=None):
+        self.owner = slots is not None
+        if self.owner:
+            size = RING_HEADER_SIZE + slots * slot_size
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                # Кольцо осталось от аварийно завершённого процесса
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            RING_HEADER.pack_into(self.shm.buf, 0, RING_MAGIC, VERSION, 0, slots, slot_size)
+        else:
+            self.shm = _attach(name)
+            magic, version, _, slots, slot_size = RING_HEADER.unpack_from(self.shm.buf, 0)
+            if magic != RING_MAGIC or version != VERSION:
+                raise ValueError(f"{name}: неизвестный формат кольца")
+        self.name = name
+        self.slots, self.slot_size = slots, slot_size
+        self.count = np.ndarray((1,), np.uint64, self.shm.buf, 16)  # Число записанных кадров
+        if self.owner:
+            self.count[0] = 0
+
+    def slot_offset(self, seq):
+        return RING_HEADER_SIZE + (seq % self.slots) * self.slot_size
+
+    def write(self, seq, timestamp, magnitudes, cap_heights=None):
+        # Возвращает представление записанного кадра (для отправки по сети без повторного кодирования)
+        offset = self.slot_offset(seq)
+        buf = self.shm.buf
+        struct.pack_into("<I", buf, offset + SEQ_OFFSET, 0)  # Слот переписывается
+        size = encode_frame(buf, offset, seq, timestamp, magnitudes, cap_heights)
+        self.count[0] = seq
+        return buf[offset:offset + size]
+
+    def frame_seq(self, seq):
+        return struct.unpack_from("<I", self.shm.buf, self.slot_offset(seq) + SEQ_OFFSET)[0]
+
+    def close(self):
+        self.count = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class FeedReader:
+    # Читатель кольца в другом процессе. Кадры — представления разделяемой памяти: их нужно
+    # обработать (или скопировать) до того, как писатель обойдёт кольцо; valid() это проверяет.
+    def __init__(self, name):
+        self.ring = FeedRing(name)
+        self.seen = int(self.ring.count[0])
+        self.lost = 0  # Кадры, перезаписанные до чтения
+
+    def valid(self, frame):
+        return self.ring.frame_seq(frame.seq) == frame.seq
+
+    def latest(self):
+        seq = int(self.ring.count[0])
+        if seq == self.seen:
+            return None
+        self.lost += max(0, seq - self.seen - 1)
+        self.seen = seq
+        frame = decode_frame(self.ring.shm.buf, self.ring.slot_offset(seq))
+        return frame if frame.seq == seq & 0xFFFFFFFF else None
+
+    def follow(self):
+        # Все кадры после последнего прочитанного, по порядку; обогнанные писателем пропускаются
+        seq = int(self.ring.count[0])
+        first = max(self.seen + 1, seq - self.ring.slots + 2)
+        self.lost += first - self.seen - 1
+        frames = []
+        for n in range(first, seq + 1):
+            frame = decode_frame(self.ring.shm.buf, self.ring.slot_offset(n))
+            if frame.seq == n & 0xFFFFFFFF:
+                frames.append(frame)
+            else:
+                self.lost += 1
+        self.seen = seq
+        return frames
+
+    def close(self):
+        self.ring.close()
+
+
+class SocketSender:
+    # Отправка кадров по UDP или Unix-сокету в отдельном потоке. publish только кладёт кадр в
+    # ограниченную очередь (при переполнении старые кадры вытесняются), поэтому медленный
+    # получатель не задерживает анализ. Поток отправляет не чаще max_rate раз в секунду:
+    # накопленные кадры уходят пачкой в одной датаграмме, а при coalesce — только последний.
+    def __init__(self, address, max_rate=0.0, coalesce=True, queue_size=32, max_datagram=MAX_DATAGRAM):
+        self.address = address
+        family, self.target = parse_address(address)
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.interval = 1.0 / max_rate if max_rate else 0.0
+        self.coalesce = coalesce
+        self.max_datagram = max_datagram
+        self.pending = collections.deque(maxlen=queue_size)
+        self.sent = 0  # Отправленные кадры
+        self.datagrams = 0
+        self.dropped = 0  # Вытесненные, объединённые или не доставленные кадры
+        self.errors = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"feed {address}", daemon=True)
+        self.thread.start()
+
+    def publish(self, frame):
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(frame)
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            self._flush()
+            if self.interval:
+                self._stop.wait(self.interval)  # Ограничение частоты: кадры копятся до следующей отправки
+
+    def _flush(self):
+        frames = []
+        while self.pending:
+            frames.append(self.pending.popleft())
+        if self.coalesce and len(frames) > 1:
+            self.dropped += len(frames) - 1
+            frames = frames[-1:]
+        batch, count = bytearray(), 0
+        for frame in frames:
+            if batch and len(batch) + len(frame) > self.max_datagram:
+                self._send(batch, count)
+                batch, count = bytearray(), 0
+            batch += frame
+            count += 1
+        if batch:
+            self._send(batch, count)
+
+    def _send(self, data, count):
+        try:
+            self.socket.sendto(data, self.target)
+            self.sent += count
+            self.datagrams += 1
+        except OSError:
+            # Получатель не слушает или буфер сокета полон: кадры теряются, анализ не ждёт
+            self.dropped += count
+            self.errors += 1
+
+    def stats(self):
+        return {'address': self.address, 'sent': self.sent, 'datagrams': self.datagrams,
+                'dropped': self.dropped, 'errors': self.errors}
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self.thread.join(1.0)
+        self.socket.close()
+
+
+class FeedListener:
+    # Приёмник датаграмм для проверки и простых потребителей
+    def __init__(self, address):
+        family, self.target = parse_address(address)
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        if family == getattr(socket, "AF_UNIX", None):
+            try:
+                os.unlink(self.target)
+            except FileNotFoundError:
+                pass
+        self.socket.bind(self.target)
+        self.buffer = bytearray(1 << 16)
+
+    def receive(self, timeout=1.0):
+        # Кадры одной датаграммы; представления внутреннего буфера до следующего receive
+        self.socket.settimeout(timeout)
+        try:
+            size = self.socket.recv_into(self.buffer)
+        except socket.timeout:
+            return []
+        frames, offset = [], 0
+        view = memoryview(self.buffer)[:size]
+        while offset < size:
+            frame = decode_frame(view, offset)
+            frames.append(frame)
+            offset += frame.size
+        return frames
+
+    def close(self):
+        self.socket.close()
+        if self.socket.family == getattr(socket, "AF_UNIX", None):
+            os.unlink(self.target)
+
+
+class OutputFeed:
+    # Публикация каждого кадра анализа во внешние потребители: кольцо в разделяемой памяти
+    # (кадр кодируется прямо в слот) и сокеты (одна копия кодированного кадра на отправку)
+    def __init__(self, ring_name=None, targets=(), max_rate=0.0, coalesce=True, slots=64, sources=1, bars=100):
+        self.seq = 0
+        size = frame_size(sources, bars, True)
+        self.ring = FeedRing(ring_name, slots, (size + 7) // 8 * 8) if ring_name else None
+        self.senders = [SocketSender(target, max_rate, coalesce) for target in targets]
+        self._scratch = bytearray(size)
+
+    def publish(self, magnitudes, cap_heights=None):
+        self.seq += 1
+        timestamp = time.time()
+        if self.ring is not None:
+            frame = self.ring.write(self.seq, timestamp, magnitudes, cap_heights)
+        else:
+            size = encode_frame(self._scratch, 0, self.seq, timestamp, magnitudes, cap_heights)
+            frame = memoryview(self._scratch)[:size]
+        if self.senders:
+            data = bytes(frame)
+            for sender in self.senders:
+                sender.publish(data)
+        frame.release()
+
+    def stats(self):
+        return [sender.stats() for sender in self.senders]
+
+    def close(self):
+        for sender in self.senders:
+            sender.close()
+        if self.ring is not None:
+            self.ring.close()
+
+
+def report(poll):
+    # Частота кадров, разрывы нумерации и задержка доставки раз в секунду
+    print("Ожидание кадров, Ctrl+C — выход")
+    frames, last_seq, gaps, started = 0, None, 0, time.perf_counter()
+    while True:
+        for frame in poll():
+            if last_seq is not None and frame.seq != last_seq + 1:
+                gaps += 1
+            last_seq = frame.seq
+            frames += 1
+            shape, peak, delay = frame.magnitudes.shape, float(frame.magnitudes.max()), time.time() - frame.timestamp
+        elapsed = time.perf_counter() - started
+        if elapsed >= 1.0:
+            if frames:
+                print(f"{frames / elapsed:.1f} кадров/с, номер {last_seq}, разрывов {gaps}, форма {shape}, "
+                      f"пик {peak:.2f}, задержка {delay * 1000:.1f} мс")
+            frames, started = 0, time.perf_counter()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Приём выходного потока спектра (проверка и отладка)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    listen = sub.add_parser("listen", help="Слушать UDP или Unix-сокет")
+    listen.add_argument("address", help="udp://host:port или unix:///path")
+    follow = sub.add_parser("follow", help="Следить за кольцом в разделяемой памяти")
+    follow.add_argument("name", help="Имя кольца (feed_ring в config.json)")
+    args = parser.parse_args()
+
+    if args.command == "listen":
+        source = FeedListener(args.address)
+        poll = source.receive
+    else:
+        source = FeedReader(args.name)
+
+        def poll():
+            frames = source.follow()
+            if not frames:
+                time.sleep(0.005)
+            return frames
+    try:
+        report(poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.close()
+
+
+if __name__ == "__main__":
+    main()
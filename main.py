@@ -1,33 +1,56 @@
-import numpy as np
-import pygame
-import sounddevice as sd
+try:
+    import time
+except ImportError as e:
+    print(f"Ошибка импорта time: {e}")
+    raise
+
+STARTED = time.time()  # Начало запуска: отсюда считается фаза импорта
+
 import tkinter as tk
 from tkinter import ttk, messagebox
 import queue
-import threading
+from contextlib import ExitStack
 import json
+import multiprocessing
 import os
+import threading
+
+# numpy, pygame, sounddevice и модули анализа и отрисовки импортируются там, где нужны:
+# GUI обходится без них, процесс анализа — без pygame, процесс отрисовки — без PortAudio
+from console import LogSink
+from metrics import Metrics, Overlay, StartupTimer
+from pipeline import Pipeline
 
-try:
-    import time
-except ImportError as e:
-    print(f"Ошибка импорта time: {e}")
-    raise
+
+def load_sounddevice():
+    # Импорт sounddevice инициализирует PortAudio и перебирает все устройства, поэтому он
+    # откладывается до захвата или обновления списка устройств
+    try:
+        import sounddevice
+    except OSError as e:
+        # Нет PortAudio: доступны воспроизведение записей сессий и офлайн-анализ
+        raise RuntimeError(f"sounddevice недоступен: {e}") from e
+    return sounddevice
 
 
 class AudioVisualizer:
     def __init__(self):
         # Параметры по умолчанию
-        self.CHUNK = 2048  # Размер буфера
+        self.CHUNK = 2048  # Размер окна анализа
+        self.HOP = 1024  # Шаг между окнами (перекрытие = 1 - HOP / CHUNK)
+        self.RING_CHUNKS = 8  # Ёмкость кольцевого буфера в окнах анализа
         self.RATE = 48000  # Частота дискретизации
+        self.TARGET_FPS = 60  # Целевая частота кадров
         self.BARS = 50  # Количество баров
         self.WIDTH, self.HEIGHT = 800, 600  # Размер окна
         self.SCALE = 2  # Чувствительность
         self.AUTO_SCALE = False  # Автоматическая подстройка
+        self.AUTO_SCALE_SMOOTHING = 0.1  # Доля приближения к целевой чувствительности за шаг анализа
         self.MIN_BAR_HEIGHT = 10  # Минимальная высота бара
         self.GAIN = 2.0  # Усиление входного сигнала
         self.FFT_GAIN = 10.0  # Усиление FFT амплитуд
         self.MAX_BAR_HEIGHT = 0.8  # Максимальная высота бара
+        self.FREQ_SCALE = "linear"  # Шкала частот: linear, log, mel, octave
         self.DECAY_FACTOR = 0.5  # Коэффициент угасания баров
         self.BORDER_RADIUS = 0  # Скругление углов баров
         self.USE_CAPS = False  # Использовать крышки
@@ -37,6 +60,31 @@ class AudioVisualizer:
         # Путь к конфигурации
         self.config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
 
+        # Шкалы частот
+        self.FREQ_SCALES = {
+            "Линейная": "linear",
+            "Логарифмическая": "log",
+            "Мел": "mel",
+            "1/3 октавы": "octave"
+        }
+
+        # Режимы каналов и раскладки групп баров
+        self.CHANNEL_MODES = {
+            "Моно": "mono",
+            "Стерео (L/R)": "stereo",
+            "Mid/Side": "mid_side",
+            "Несколько устройств": "devices"
+        }
+        self.LAYOUTS = {
+            "Зеркально": "mirrored",
+            "Друг над другом": "stacked"
+        }
+        self.VISUAL_MODES = {
+            "Бары": "bars",
+            "Спектрограмма": "spectrogram",
+            "Водопад": "waterfall"
+        }
+
         # Цвета для баров (RGB)
         self.COLORS = {
             "Циан": (0, 255, 255),
@@ -59,16 +107,52 @@ class AudioVisualizer:
         self.use_caps = self.USE_CAPS
         self.cap_decay_factor = self.CAP_DECAY_FACTOR
         self.debug_output = self.DEBUG_OUTPUT
+        self.target_fps = self.TARGET_FPS
+        self.freq_scale = self.FREQ_SCALE
+        self.f_min, self.f_max = None, None  # Диапазон частот, Гц (None — по умолчанию для шкалы)
+        self.channel_mode = "mono"  # Каналы: mono, stereo, mid_side, devices
+        self.extra_devices = []  # Дополнительные устройства для режима devices
+        self.layout = "mirrored"  # Раскладка групп баров: mirrored, stacked
+        self.visual_mode = "bars"  # Вид: bars, spectrogram, waterfall
+        self.feed_ring = None  # Имя кольца выходного потока в разделяемой памяти
+        self.feed_targets = []  # Адреса получателей выходного потока (udp://host:port, unix:///path)
+        self.feed_rate = 0.0  # Предел частоты отправки, Гц (0 — без ограничения)
+        self.feed_coalesce = True  # Отправлять только последний кадр из накопившихся
+        self.record_file = None  # Файл для записи блоков захвата
+        self.replay_file = None  # Запись, воспроизводимая вместо устройства
+        self.replay_realtime = True  # Исходный темп воспроизведения или максимальная скорость
+        self.busy_loop = False  # Точное ожидание кадра ценой загрузки ядра
+        self.beat_flash = False  # Вспышка на долях
+        self.band_stats = None  # Потоковая статистика полос (для автоматической чувствительности)
+        self.onset = None  # Детектор долей и темпа
+        self.level = 0.0  # Устойчивый уровень спектра для автоматической чувствительности
+        self.flash = None  # Вспышка на долях (в процессе отрисовки)
+        self.last_onsets = 0
         self.last_magnitudes = None
         self.last_cap_heights = None
+        self.spectrum = None  # План спектрального анализа
+        self.ring = None  # Кольцевой буфер захвата
+        self.latency = None  # Измеритель задержки
+        self.metrics = Metrics()  # Таймеры стадий и счётчики
+        self.overlay = None  # Экранная панель метрик
+        self.scheduler = None  # Планировщик кадров
+        self.renderer = None  # Отрисовщик баров
+        self.adaptive_quality = True  # Понижать качество отрисовки при нехватке времени кадра
+        self.governor = None  # Регулятор качества (в процессе отрисовки)
         self.screen_width, self.screen_height = None, None
         self.screen = None
-        self.console = None
-        self.running = True  # Флаг для управления потоком
-
-        # Инициализация Pygame
+        self.console = LogSink()  # Сообщения для консоли GUI
+        self.running = True  # Флаг для управления циклом процесса
+        self.pipeline = Pipeline()  # Процессы захвата и отрисовки
+        self.startup = StartupTimer(STARTED)  # Фазы запуска процесса
+        self.input_devices = []  # Устройства ввода (индекс, имя), кэш из config.json
+
+    def init_display(self):
+        # Окно создаётся только в процессе отрисовки; из подсистем pygame нужен только дисплей
+        # (pygame.init открыл бы ещё звук и джойстики), шрифты — с первой панелью метрик
+        import pygame
         try:
-            pygame.init()
+            pygame.display.init()
             self.screen = pygame.display.set_mode((self.WIDTH, self.HEIGHT), pygame.RESIZABLE)
             pygame.display.set_caption("Аудиовизуализатор (Микрофон)")
             self.screen_width, self.screen_height = pygame.display.Info().current_w, pygame.display.Info().current_h
@@ -78,189 +162,458 @@ class AudioVisualizer:
             print(f"Ошибка инициализации Pygame: {e}")
             raise
 
-    def hsv_to_rgb(self, h, s=1, v=1):
-        import colorsys
-        v = min(v, 1.0)  # Ограничиваем яркость для HSV
-        return tuple(int(i * 255) for i in colorsys.hsv_to_rgb(h, s, v))
+    def get_spectrum(self, channels=1):
+        # План анализа перестраивается только при смене CHUNK, RATE, количества баров, шкалы частот
+        # или числа источников
+        settings = (self.CHUNK, self.RATE, self.current_bars, self.freq_scale, self.f_min, self.f_max, channels)
+        if self.spectrum is None or not self.spectrum.matches(*settings):
+            from spectrum import SpectrumAnalyzer
+            self.spectrum = SpectrumAnalyzer(self.CHUNK, self.RATE, self.current_bars, self.GAIN, self.FFT_GAIN,
+                                             self.freq_scale, self.f_min, self.f_max, channels)
+            self.last_magnitudes = self.spectrum.magnitudes
+            self.last_cap_heights = self.spectrum.cap_heights
+        return self.spectrum
+
+    def update_auto_scale(self, level, height):
+        # level — p95 самой громкой полосы из потоковой статистики, а не мгновенный максимум,
+        # поэтому чувствительность не качается на каждом всплеске
+        if level > 0:
+            target_scale = max(0.1, min(5, level / (height / 5)))
+            self.current_scale = self.last_scale + self.AUTO_SCALE_SMOOTHING * (target_scale - self.last_scale)
+            self.last_scale = self.current_scale
+        self.metrics.gauge('scale', self.current_scale)
+
+    def update_levels(self, magnitudes, step_rate):
+        # Потоковая статистика отображаемых амплитуд по полосам; возвращает уровень для чувствительности
+        if self.band_stats is None or not self.band_stats.matches(magnitudes.shape, step_rate):
+            from streamstats import BandStats
+            self.band_stats = BandStats(magnitudes.shape, step_rate)
+        self.band_stats.update(magnitudes)
+        self.level = float(self.band_stats.percentile(0.95).max())
+        return self.level
+
+    def beat_stats(self):
+        # (уровень, счётчик долей, сила последней доли, темп, уверенность) в порядке STATS
+        onset = self.onset
+        if onset is None:
+            return self.level, 0, 0.0, 0.0, 0.0
+        return self.level, onset.onsets, onset.strength, onset.tempo, onset.confidence
+
+    def update_onsets(self, raw, step_rate):
+        # Доли и темп по барам до угасания (логарифмические амплитуды уже посчитанного FFT)
+        if self.onset is None or not self.onset.matches(raw.shape, step_rate):
+            from streamstats import OnsetDetector
+            self.onset = OnsetDetector(raw.shape, step_rate)
+        return self.onset.update(raw)
 
     def analyze_audio(self, data):
         try:
-            raw_amplitude = np.max(np.abs(data))
-            if self.debug_output:
-                print(f"Сырая амплитуда: {raw_amplitude:.2f}")
-
-            fft_data = np.fft.fft(data * self.GAIN)
-            fft_magnitude = np.abs(fft_data)[:self.CHUNK // 4] * self.FFT_GAIN
-            fft_magnitude = np.log1p(fft_magnitude)  # Мягкое логарифмическое масштабирование
-            bar_width = len(fft_magnitude) // self.current_bars
-            bar_magnitudes = []
-            for i in range(0, len(fft_magnitude), bar_width):
-                if len(bar_magnitudes) < self.current_bars:
-                    bar_magnitudes.append(np.mean(fft_magnitude[i:i + bar_width]))
-            while len(bar_magnitudes) < self.current_bars:
-                bar_magnitudes.append(0)
-
-            # Подавление первых 3 баров
-            for i in range(min(3, len(bar_magnitudes))):
-                bar_magnitudes[i] *= 0.5
-
-            # Угасание амплитуд баров
-            if self.last_magnitudes is None or len(self.last_magnitudes) != self.current_bars:
-                self.last_magnitudes = [0] * self.current_bars
-            decayed_magnitudes = []
-            for i, magnitude in enumerate(bar_magnitudes):
-                if i < len(self.last_magnitudes) and magnitude < self.last_magnitudes[i]:
-                    magnitude = max(magnitude, self.last_magnitudes[i] * (1 - self.decay_factor))
-                decayed_magnitudes.append(magnitude)
+            spectrum = self.get_spectrum(1 if data.ndim == 1 else len(data))
+            started = time.perf_counter()
+            spectrum.transform(data)
+            transformed = time.perf_counter()
+            raw = spectrum.reduce()
+            binned = time.perf_counter()
+            decayed_magnitudes = spectrum.decay(raw, self.decay_factor, self.use_caps, self.cap_decay_factor)
             self.last_magnitudes = decayed_magnitudes
-
-            # Угасание крышек
-            if self.use_caps:
-                if self.last_cap_heights is None or len(self.last_cap_heights) != self.current_bars:
-                    self.last_cap_heights = [0] * self.current_bars
-                cap_heights = []
-                for i, magnitude in enumerate(decayed_magnitudes):
-                    if magnitude > self.last_magnitudes[i] * (1 - self.decay_factor):  # Если бар растёт
-                        cap_height = 10  # Фиксированная высота крышки
-                    else:
-                        cap_height = max(0, self.last_cap_heights[i] * (1 - self.cap_decay_factor))  # Угасание
-                    cap_heights.append(cap_height)
-                self.last_cap_heights = cap_heights
-            else:
-                self.last_cap_heights = [0] * self.current_bars
-
-            if self.debug_output:
-                print(f"Амплитуды первых 5 баров (с угасанием): {[f'{x:.2f}' for x in decayed_magnitudes[:5]]}")
-                if self.use_caps:
-                    print(f"Высота первых 5 крышек: {[f'{x:.2f}' for x in self.last_cap_heights[:5]]}")
-
+            self.last_cap_heights = spectrum.cap_heights
+            decayed = time.perf_counter()
+            step_rate = self.RATE / self.HOP
+            self.update_onsets(raw, step_rate)
             if self.AUTO_SCALE:
-                max_amplitude = max(decayed_magnitudes, default=1)
-                if max_amplitude > 0:
-                    target_scale = max(0.1, min(5, max_amplitude / (self.screen.get_height() / 5)))
-                    self.current_scale = 0.5 * self.last_scale + 0.5 * target_scale
-                    self.last_scale = self.current_scale
-                if self.debug_output:
-                    print(f"Макс. FFT амплитуда: {max_amplitude:.2f}, Чувствительность: {self.current_scale:.2f}")
-
+                self.update_levels(decayed_magnitudes, step_rate)
+            finished = time.perf_counter()
+            self.metrics.record('fft', transformed - started)
+            self.metrics.record('binning', binned - transformed)
+            self.metrics.record('decay', decayed - binned)
+            self.metrics.record('onset', finished - decayed)
             return decayed_magnitudes
         except Exception as e:
             print(f"Ошибка в analyze_audio: {e}")
-            self.console.insert(tk.END, f"Ошибка в analyze_audio: {e}\n") if self.console else None
-            return [0] * self.current_bars
+            self.console.log(f"Ошибка в analyze_audio: {e}")
+            import numpy as np
+            return np.zeros(self.current_bars)
+
+    def get_renderer(self, sources=1, bars=None, border_radius=None):
+        # Геометрия и палитра перестраиваются только при смене баров, размера окна, цвета, скругления
+        # или раскладки групп. По умолчанию — настройки пользователя; регулятор качества
+        # передаёт меньше баров и скругление
+        from renderer import BarRenderer, GroupRenderer, SpectrogramRenderer
+        bars = self.current_bars if bars is None else bars
+        border_radius = self.border_radius if border_radius is None else border_radius
+        size = self.screen.get_size()
+        if self.visual_mode != "bars":
+            settings = (self.screen, sources, bars, self.current_color, self.MAX_BAR_HEIGHT, self.visual_mode)
+            if not isinstance(self.renderer, SpectrogramRenderer) or not self.renderer.matches(*settings):
+                self.renderer = SpectrogramRenderer(*settings)
+        elif sources > 1:
+            settings = (self.screen, sources, bars, self.current_color, border_radius, self.MIN_BAR_HEIGHT,
+                        self.MAX_BAR_HEIGHT, self.layout)
+            if not isinstance(self.renderer, GroupRenderer) or not self.renderer.matches(*settings):
+                self.renderer = GroupRenderer(*settings)
+        elif not isinstance(self.renderer, BarRenderer) or not self.renderer.matches(
+                bars, size, self.current_color, border_radius, self.MIN_BAR_HEIGHT, self.MAX_BAR_HEIGHT):
+            self.renderer = BarRenderer(bars, size, self.current_color, border_radius, self.MIN_BAR_HEIGHT,
+                                        self.MAX_BAR_HEIGHT)
+        return self.renderer
 
     def visualize(self, bars):
         try:
-            self.screen.fill((0, 0, 0))
-            bar_width = self.screen.get_width() // self.current_bars
-            max_height = self.screen.get_height() * self.MAX_BAR_HEIGHT
-            for i, magnitude in enumerate(bars):
-                height = int(magnitude * 50 / self.current_scale) + self.MIN_BAR_HEIGHT
-                height = min(height, int(max_height))
-                if self.current_color is None:
-                    hue = i / self.current_bars
-                    bar_color = self.hsv_to_rgb(hue)
-                    cap_color = self.hsv_to_rgb(hue, s=1, v=1.2)  # Более яркий для крышек
-                else:
-                    bar_color = self.current_color
-                    cap_color = (255, 255, 255)  # Белый для крышек при однотонных барах
-                # Отрисовка бара
-                pygame.draw.rect(self.screen, bar_color,
-                                 (i * bar_width, self.screen.get_height() - height, bar_width - 2, height),
-                                 border_radius=self.border_radius)
-                # Отрисовка крышки с зазором
-                if self.use_caps and i < len(self.last_cap_heights):
-                    cap_height = int(self.last_cap_heights[i])
-                    cap_height = min(cap_height, int(max_height * 0.1))  # Ограничение высоты крышки
-                    if cap_height > 0:
-                        pygame.draw.rect(self.screen, cap_color, (
-                        i * bar_width, self.screen.get_height() - height - cap_height - 5, bar_width - 2, cap_height),
-                                         border_radius=self.border_radius)
-                        if self.debug_output:
-                            print(f"Крышка {i}: высота={cap_height}, цвет={cap_color}")
-            pygame.display.flip()
+            started = time.perf_counter()
+            radius, use_caps, count = self.border_radius, self.use_caps, self.current_bars
+            cap_heights = self.last_cap_heights
+            if self.governor is not None and self.visual_mode == "bars":
+                radius, use_caps, count = self.governor.effective(radius, use_caps, self.current_bars)
+                bars = self.governor.reduce(bars, count)
+                if use_caps and cap_heights is not None:
+                    cap_heights = self.governor.reduce(cap_heights, count)
+            renderer = self.get_renderer(1 if bars.ndim == 1 else len(bars), count, radius)
+            if not self.debug_output and self.overlay is not None:
+                # Панель скрыта: перерисовать экран без неё
+                self.overlay = None
+                renderer.invalidate()
+            dirty = renderer.draw(self.screen, bars, cap_heights if use_caps else None, self.current_scale,
+                                  present=False)
+            if self.flash is not None and self.visual_mode == "bars":
+                # Полоса вспышки поверх баров; после полной перерисовки экрана — заново
+                flash_rect = self.flash.draw(self.screen, self.current_color, force=dirty is None)
+                if dirty is not None and flash_rect is not None:
+                    dirty.append(flash_rect)
+            if self.debug_output:
+                if self.overlay is None:
+                    self.overlay = Overlay()
+                self.overlay.update(self.metrics, self.scheduler.stats if self.scheduler else None)
+                # Водопад сдвигается вниз, поэтому панель внизу: иначе она оставляла бы след
+                overlay_rect = self.overlay.draw(self.screen, bottom=self.visual_mode == "waterfall")
+                if dirty is not None and overlay_rect is not None:
+                    dirty.append(overlay_rect)
+            drawn = time.perf_counter()
+            renderer.present(dirty)
+            self.metrics.record('draw', drawn - started)
+            self.metrics.record('flip', time.perf_counter() - drawn)
         except Exception as e:
             print(f"Ошибка в visualize: {e}")
-            self.console.insert(tk.END, f"Ошибка в visualize: {e}\n") if self.console else None
+            self.console.log(f"Ошибка в visualize: {e}")
+
+    def make_callback(self, ring, channels, recorder=None, stream=0):
+        def audio_callback(indata, frames, time_info, status):
+            # Callback драйвера: только копирование в кольцевой буфер (и в запись сессии), без блокировок
+            if status:
+                self.metrics.status(status)
+            if recorder is not None:
+                recorder.write(stream, indata, status, time_info)
+            ring.write(indata[:, 0] if channels == 1 else indata)
+        return audio_callback
+
+    def source_count(self, settings=None):
+        # По текущим настройкам или по словарю конфигурации (например, с параметрами записи)
+        channel_mode = self.channel_mode if settings is None else settings['channel_mode']
+        extra_devices = self.extra_devices if settings is None else settings['extra_devices']
+        if channel_mode in ("stereo", "mid_side"):
+            return 2
+        if channel_mode == "devices":
+            return 1 + len(extra_devices)
+        return 1
+
+    def toggle_borderless(self, borderless=None):
+        import pygame
+        self.borderless = not self.borderless if borderless is None else borderless
+        try:
+            if self.borderless:
+                self.screen = pygame.display.set_mode((self.screen_width, self.screen_height), pygame.NOFRAME)
+                pygame.display.set_caption("Аудиовизуализатор (Безрамочный)")
+                print(f"Переключение в безрамочный режим: {self.screen_width}x{self.screen_height}")
+                self.console.log(f"Switched to borderless mode: {self.screen_width}x{self.screen_height}")
+            else:
+                self.screen = pygame.display.set_mode((self.WIDTH, self.HEIGHT), pygame.RESIZABLE)
+                pygame.display.set_caption("Аудиовизуализатор (Микрофон)")
+                print(f"Переключение в оконный режим: {self.WIDTH}x{self.HEIGHT}")
+                self.console.log(f"Switched to windowed mode: {self.WIDTH}x{self.HEIGHT}")
+        except Exception as e:
+            print(f"Ошибка переключения режима: {e}")
+            self.console.log(f"Ошибка переключения режима: {e}")
 
-    def microphone_source(self, data_queue, device_index):
+    def poll_control(self, control):
+        # Команды GUI: новые настройки, смена режима окна, остановка
+        while not control.empty():
+            try:
+                kind, payload = control.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'settings':
+                self.apply_config(payload)
+                if self.scheduler is not None:
+                    self.scheduler.target_fps = self.target_fps
+                    self.scheduler.busy_loop = self.busy_loop
+            elif kind == 'borderless' and self.screen is not None:
+                self.toggle_borderless()
+            elif kind == 'stop':
+                self.running = False
+
+    def report_startup(self, phase, title):
+        # Последняя фаза запуска процесса: сводка по фазам в консоль и GUI
+        self.startup.mark(phase)
+        self.startup.finished = True
+        print(f"{title}: {self.startup.summary()}")
+        self.console.log(f"{title}: {self.startup.summary()}")
+
+    def record_analysis(self, stats):
+        # Показатели процесса анализа, пришедшие вместе со спектром
+        from shared import STATS
+        for name, value in zip(STATS, stats):
+            if name in self.metrics.stages:
+                self.metrics.record(name, value)
+            elif name == 'xruns':
+                self.metrics.counters['xruns'] = int(value)
+            elif name in ('queue_depth', 'dropped_samples', 'onsets'):
+                self.metrics.gauge(name, int(value))
+            else:
+                self.metrics.gauge(name, float(value))
+
+    def create_feed(self, sources):
+        # Выходной поток для внешних потребителей, если он настроен
+        if not self.feed_ring and not self.feed_targets:
+            return None
+        from feed import OutputFeed
+        from pipeline import MAX_BARS
+        feed = OutputFeed(self.feed_ring, self.feed_targets, self.feed_rate, self.feed_coalesce,
+                          sources=sources, bars=max(self.current_bars, MAX_BARS))
+        print(f"Выходной поток: кольцо {self.feed_ring}, получатели {self.feed_targets}")
+        return feed
+
+    def capture_loop(self, device_index, shared, control):
+        # Процесс захвата и анализа: спектр каждого шага публикуется в разделяемую память
+        from capture import (FrameReader, LatencyMeter, MultiFrameReader, RingBuffer, SourceMixer, device_channels,
+                             source_matrix)
+        from recorder import SessionRecorder, SessionReplay, session_settings
+        self.startup.mark("запуск процесса")
+        feed = recorder = replay = None
         try:
-            device_name = sd.query_devices(device_index)['name']
+            if self.replay_file:
+                # Воспроизведение записи: параметры захвата берутся из неё
+                replay = SessionReplay(self.replay_file, self.replay_realtime)
+                self.apply_config(dict(self.config_dict(), **session_settings(replay.info)))
+                device_index, device_name = self.current_device, f"запись {self.replay_file}"
+            else:
+                sd = load_sounddevice()
+                device_name = sd.query_devices(device_index)['name']
             print(f"Запуск визуализации с устройства {device_index}: {device_name}")
-            self.console.insert(tk.END, f"Запуск визуализации с устройства {device_name}\n") if self.console else None
-            with sd.InputStream(device=device_index, samplerate=self.RATE, channels=1, blocksize=self.CHUNK,
-                                callback=lambda indata, frames, time, status: data_queue.put(
-                                        indata[:, 0]) if not status else print(status), latency='low'):
+            self.console.log(f"Запуск визуализации с устройства {device_name}")
+            devices = [device_index] + (list(self.extra_devices) if self.channel_mode == "devices" else [])
+            channels = device_channels(self.channel_mode)
+            sources = self.source_count()
+            rings = [RingBuffer(self.CHUNK * self.RING_CHUNKS, channels=channels) for _ in devices]
+            self.ring = rings[0]
+            window = self.get_spectrum(sources).fft_size
+            readers = [FrameReader(ring, window, self.HOP) for ring in rings]
+            reader = readers[0] if len(readers) == 1 else MultiFrameReader(readers)
+            mixer = SourceMixer(source_matrix(self.channel_mode, channels * len(devices))) if sources > 1 else None
+            feed = self.create_feed(sources)
+            if self.record_file:
+                recorder = SessionRecorder(self.record_file, {
+                    'rate': self.RATE, 'hop': self.HOP, 'channels': channels, 'channel_mode': self.channel_mode,
+                    'devices': devices, 'created': time.strftime("%Y-%m-%dT%H:%M:%S")})
+                print(f"Запись сессии в {self.record_file}")
+            callbacks = [self.make_callback(ring, channels, recorder, stream) for stream, ring in enumerate(rings)]
+            with ExitStack() as stack:
+                if replay is not None:
+                    streams = [stack.enter_context(replay.start(callbacks))]
+                else:
+                    streams = [stack.enter_context(sd.InputStream(device=device, samplerate=self.RATE,
+                                                                  channels=channels, blocksize=self.HOP,
+                                                                  latency='low', callback=callback))
+                               for device, callback in zip(devices, callbacks)]
+                self.startup.mark("открытие устройства")
+                if recorder is not None:
+                    recorder.info['latency'] = max(stream.latency for stream in streams)
+                if len(devices) > 1:
+                    print(f"Дополнительные устройства: {devices[1:]}")
+                self.latency = LatencyMeter(self.RATE, self.HOP, max(stream.latency for stream in streams))
+                print(f"Окно {reader.window}, шаг {self.HOP} (перекрытие {reader.overlap:.0%}), "
+                      f"предел задержки {self.latency.bound * 1000:.1f} мс")
+                self.console.log(f"Latency bound: {self.latency.bound * 1000:.1f} ms")
+                pause = self.HOP / self.RATE / 4  # Опрос буфера несколько раз за шаг
+                stages = self.metrics.stages
                 while self.running:
-                    for event in pygame.event.get():
-                        if event.type == pygame.QUIT:
-                            self.running = False
-                            break
-                        elif event.type == pygame.KEYDOWN:
-                            if event.key == pygame.K_F11:
-                                self.borderless = not self.borderless
-                                try:
-                                    if self.borderless:
-                                        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height),
-                                                                              pygame.NOFRAME)
-                                        pygame.display.set_caption("Аудиовизуализатор (Безрамочный)")
-                                        print(
-                                            f"Переключение в безрамочный режим: {self.screen_width}x{self.screen_height}")
-                                        self.console.insert(tk.END,
-                                                            f"Switched to borderless mode: {self.screen_width}x{self.screen_height}\n")
-                                    else:
-                                        self.screen = pygame.display.set_mode((self.WIDTH, self.HEIGHT),
-                                                                              pygame.RESIZABLE)
-                                        pygame.display.set_caption("Аудиовизуализатор (Микрофон)")
-                                        print(f"Переключение в оконный режим: {self.WIDTH}x{self.HEIGHT}")
-                                        self.console.insert(tk.END,
-                                                            f"Switched to windowed mode: {self.WIDTH}x{self.HEIGHT}\n")
-                                except Exception as e:
-                                    print(f"Ошибка переключения режима: {e}")
-                                    self.console.insert(tk.END, f"Ошибка переключения режима: {e}\n")
-                            elif event.key == pygame.K_ESCAPE and self.borderless:
-                                self.borderless = False
-                                try:
-                                    self.screen = pygame.display.set_mode((self.WIDTH, self.HEIGHT), pygame.RESIZABLE)
-                                    pygame.display.set_caption("Аудиовизуализатор (Микрофон)")
-                                    print(f"Выход из безрамочного режима: {self.WIDTH}x{self.HEIGHT}")
-                                    self.console.insert(tk.END,
-                                                        f"Switched to windowed mode: {self.WIDTH}x{self.HEIGHT}\n")
-                                except Exception as e:
-                                    print(f"Ошибка выхода из безрамочного режима: {e}")
-                                    self.console.insert(tk.END, f"Ошибка выхода из безрамочного режима: {e}\n")
-                        elif event.type == pygame.VIDEORESIZE and not self.borderless:
-                            try:
-                                self.screen = pygame.display.set_mode((event.w, event.h), pygame.RESIZABLE)
-                                print(f"Новое разрешение окна: {event.w}x{event.h}")
-                                self.console.insert(tk.END, f"Window resized to: {event.w}x{event.h}\n")
-                            except Exception as e:
-                                print(f"Ошибка изменения размера окна: {e}")
-                                self.console.insert(tk.END, f"Ошибка изменения размера окна: {e}\n")
-
+                    self.poll_control(control)
+                    self.console.flush()  # Сообщения уходят в GUI пачкой, не чаще интервала журнала
                     try:
-                        if not data_queue.empty():
-                            data = data_queue.get_nowait()
-                            bars = self.analyze_audio(data)
-                            self.visualize(bars)
-                        time.sleep(0.02)
-                    except queue.Empty:
-                        pass
+                        # Запись закончилась, но поданные последними шаги ещё лежат в кольце: конец — когда их нет
+                        replayed = replay is not None and not replay.pump()
+                        reader.resize(self.get_spectrum(sources).fft_size)
+                        data = reader.read()
+                        if data is None:
+                            if replayed:
+                                print(f"Запись воспроизведена: {replay.blocks} блоков")
+                                self.console.log(f"Replay finished: {replay.blocks} blocks")
+                                break
+                            time.sleep(pause)
+                            continue
+                        if mixer is not None:
+                            data = mixer.mix(data)
+                        latency = self.latency.update(self.ring.age())
+                        self.metrics.record('latency', latency)
+                        magnitudes = self.analyze_audio(data)
+                        shared.publish(magnitudes, self.last_cap_heights,
+                                       (stages['fft'].last, stages['binning'].last, stages['decay'].last, latency,
+                                        reader.pending(), reader.dropped, self.metrics.counters['xruns'],
+                                        stages['onset'].last) + self.beat_stats())
+                        if feed is not None:
+                            feed.publish(magnitudes, self.last_cap_heights if self.use_caps else None)
+                        if not self.startup.finished:
+                            self.report_startup("первый спектр", "Запуск анализа")
                     except Exception as e:
                         print(f"Ошибка обработки данных: {e}")
-                        self.console.insert(tk.END, f"Ошибка обработки данных: {e}\n")
+                        self.console.log(f"Ошибка обработки данных: {e}")
                         break
         except Exception as e:
             print(f"Ошибка при захвате звука с микрофона: {e}")
-            self.console.insert(tk.END, f"Ошибка микрофона: {e}\n")
+            self.console.log(f"Ошибка микрофона: {e}")
         finally:
+            if self.latency is not None and self.latency.samples:
+                print(f"Задержка: средняя {self.latency.average * 1000:.1f} мс, "
+                      f"максимальная {self.latency.maximum * 1000:.1f} мс, xruns: {self.metrics.counters['xruns']}")
+                self.console.log(f"Latency avg {self.latency.average * 1000:.1f} ms, "
+                                 f"max {self.latency.maximum * 1000:.1f} ms")
+            fft, binning = self.metrics.stages['fft'], self.metrics.stages['binning']
+            if fft.count:
+                print(f"Анализ: {fft.count} шагов, fft p50 {fft.percentile(50) * 1000:.3f} / "
+                      f"p95 {fft.percentile(95) * 1000:.3f} мс, бины p50 {binning.percentile(50) * 1000:.3f} мс")
+                if self.metrics.dump_file:
+                    # Полные гистограммы анализа; файл процесса отрисовки получает только последние значения
+                    self.metrics.dump_file = os.path.splitext(self.metrics.dump_file)[0] + ".analysis.json"
+                    self.metrics.dump()
+            if recorder is not None:
+                recorder.close()
+                print(f"Записано блоков: {recorder.records} в {self.record_file}")
+            if feed is not None:
+                for stats in feed.stats():
+                    print(f"Выходной поток {stats['address']}: отправлено {stats['sent']}, "
+                          f"пропущено {stats['dropped']}")
+                feed.close()
+            print("Завершение захвата")
+
+    def render_loop(self, shared, control):
+        # Процесс отрисовки: события окна, новый спектр из разделяемой памяти, интерполяция и вывод
+        import pygame
+        from renderer import BeatFlash
+        from scheduler import FrameScheduler, QualityGovernor, SpectrumInterpolator
+        self.startup.mark("запуск процесса")
+        try:
+            self.init_display()
+            self.startup.mark("окно")
+            self.scheduler = FrameScheduler(self.target_fps, self.busy_loop)
+            interpolator = None
+            redraw = True
+            while self.running:
+                self.scheduler.begin_frame()
+                self.poll_control(control)
+                self.console.flush()
+                if self.beat_flash != (self.flash is not None):
+                    self.flash = BeatFlash() if self.beat_flash else None
+                    redraw = True
+                    if self.renderer is not None:
+                        self.renderer.invalidate()  # Стереть полосу выключенной вспышки
+                if self.adaptive_quality != (self.governor is not None):
+                    # Регулятор включён или выключен из GUI; выключение возвращает полное качество
+                    self.governor = QualityGovernor() if self.adaptive_quality else None
+                    redraw = True
+                for event in pygame.event.get():
+                    if event.type in (pygame.KEYDOWN, pygame.VIDEORESIZE, pygame.WINDOWEXPOSED):
+                        redraw = True
+                        if self.renderer is not None:
+                            self.renderer.invalidate()
+                    if event.type == pygame.QUIT:
+                        self.running = False
+                        break
+                    elif event.type == pygame.KEYDOWN:
+                        if event.key == pygame.K_F3:
+                            # Панель метрик и периодический лог
+                            self.debug_output = not self.debug_output
+                        elif event.key == pygame.K_F11:
+                            self.toggle_borderless()
+                        elif event.key == pygame.K_ESCAPE and self.borderless:
+                            self.toggle_borderless(False)
+                    elif event.type == pygame.VIDEORESIZE and not self.borderless:
+                        try:
+                            self.screen = pygame.display.set_mode((event.w, event.h), pygame.RESIZABLE)
+                            print(f"Новое разрешение окна: {event.w}x{event.h}")
+                            self.console.log(f"Window resized to: {event.w}x{event.h}")
+                        except Exception as e:
+                            print(f"Ошибка изменения размера окна: {e}")
+                            self.console.log(f"Ошибка изменения размера окна: {e}")
+
+                try:
+                    drawn = False
+                    latest = shared.read()
+                    if latest is not None:
+                        magnitudes, self.last_cap_heights, stats = latest
+                        self.record_analysis(stats)
+                        gauges = self.metrics.gauges
+                        if self.AUTO_SCALE:
+                            self.update_auto_scale(gauges['level'], self.screen.get_height())
+                        if gauges['onsets'] != self.last_onsets:
+                            self.last_onsets = gauges['onsets']
+                            if self.beat_flash and self.flash is not None:
+                                self.flash.trigger(gauges['onset_strength'])
+                        if self.visual_mode == "bars":
+                            if interpolator is None or interpolator.current.shape != magnitudes.shape:
+                                interpolator = SpectrumInterpolator(magnitudes.shape, self.HOP / self.RATE)
+                            interpolator.push(magnitudes)
+                        else:
+                            # Спектрограмма дописывает по столбцу на каждый шаг анализа, без интерполяции
+                            self.visualize(magnitudes)
+                            drawn = True
+                    # Между шагами анализа бары интерполируются; неизменный кадр не перерисовывается
+                    flashing = self.flash is not None and self.flash.active
+                    if self.visual_mode == "bars" and interpolator is not None \
+                            and (redraw or flashing or not interpolator.settled) and self.scheduler.should_draw():
+                        self.visualize(interpolator.value())
+                        redraw = False
+                        drawn = True
+                    if drawn and not self.startup.finished:
+                        self.report_startup("первый кадр", "Запуск отрисовки")
+                    self.scheduler.end_frame()
+                    if self.governor is not None:
+                        # Нагрузку дают только отрисованные кадры баров: неизменный кадр ничего не стоит
+                        if drawn and self.visual_mode == "bars":
+                            self.governor.observe(self.scheduler.work_time, self.scheduler.budget)
+                        message = self.governor.update()
+                        if message:
+                            print(message)
+                            self.console.log(message)
+                            redraw = True
+                    self.metrics.record('wait', self.scheduler.wait_time)
+                    self.metrics.log_enabled = self.debug_output
+                    self.metrics.tick(self.scheduler.stats)
+                except Exception as e:
+                    print(f"Ошибка обработки данных: {e}")
+                    self.console.log(f"Ошибка обработки данных: {e}")
+                    break
+        except Exception as e:
+            print(f"Ошибка отрисовки: {e}")
+            self.console.log(f"Ошибка отрисовки: {e}")
+        finally:
+            if self.scheduler is not None and self.scheduler.frames:
+                stats = self.scheduler.stats()
+                self.metrics.dump(stats)  # Итоговые метрики (например, после прогона записи)
+                print(self.metrics.summary_line(stats))
+                self.console.log(f"FPS {stats['fps']:.1f}, p95 {stats['frame_ms_p95']:.1f} ms, "
+                                 f"dropped {stats['dropped']}")
             print("Завершение визуализации")
-            self.console.insert(tk.END, "Визуализация завершена\n") if self.console else None
+            self.console.log("Визуализация завершена")
+            pygame.quit()
 
-    def save_config(self):
-        config = {
+    def config_dict(self):
+        return {
             'device': self.current_device,
+            'devices': [list(device) for device in self.input_devices],
             'bars': self.current_bars,
+            'hop': self.HOP,
+            'target_fps': self.target_fps,
+            'busy_loop': self.busy_loop,
+            'adaptive_quality': self.adaptive_quality,
+            'beat_flash': self.beat_flash,
             'scale': self.current_scale,
             'auto_scale': self.AUTO_SCALE,
             'color': [k for k, v in self.COLORS.items() if
@@ -269,86 +622,183 @@ class AudioVisualizer:
             'border_radius': self.border_radius,
             'use_caps': self.use_caps,
             'cap_decay_factor': self.cap_decay_factor,
-            'debug_output': self.debug_output
+            'debug_output': self.debug_output,
+            'freq_scale': self.freq_scale,
+            'f_min': self.f_min,
+            'f_max': self.f_max,
+            'channel_mode': self.channel_mode,
+            'extra_devices': self.extra_devices,
+            'layout': self.layout,
+            'visual_mode': self.visual_mode,
+            'feed_ring': self.feed_ring,
+            'feed_targets': self.feed_targets,
+            'feed_rate': self.feed_rate,
+            'feed_coalesce': self.feed_coalesce,
+            'record_file': self.record_file,
+            'replay_file': self.replay_file,
+            'replay_realtime': self.replay_realtime,
+            'metrics_file': self.metrics.dump_file,
+            'metrics_interval': self.metrics.interval
         }
+
+    def save_config(self):
+        config = self.config_dict()
         try:
             os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=4)
             print(f"Настройки сохранены в {self.config_file}: {config}")
-            if self.console:
-                self.console.insert(tk.END, f"Configuration saved to {self.config_file}\n")
+            self.console.log(f"Configuration saved to {self.config_file}")
         except Exception as e:
             print(f"Ошибка сохранения конфигурации в {self.config_file}: {e}")
-            if self.console:
-                self.console.insert(tk.END, f"Failed to save config: {str(e)}\n")
+            self.console.log(f"Failed to save config: {str(e)}")
+
+    def apply_config(self, config):
+        self.current_device = config.get('device', None)
+        self.input_devices = [(int(i), name) for i, name in config.get('devices', [])]
+        self.current_bars = config.get('bars', self.BARS)
+        self.RATE = config.get('rate', self.RATE)  # Задаётся только записью сессии, в config.json не хранится
+        self.HOP = max(1, min(self.CHUNK, config.get('hop', self.HOP)))
+        self.target_fps = max(1, config.get('target_fps', self.TARGET_FPS))
+        self.busy_loop = config.get('busy_loop', False)
+        self.adaptive_quality = config.get('adaptive_quality', True)
+        self.beat_flash = config.get('beat_flash', False)
+        self.current_scale = config.get('scale', self.SCALE)
+        self.AUTO_SCALE = config.get('auto_scale', self.AUTO_SCALE)
+        color_name = config.get('color', 'Циан')
+        self.current_color = self.COLORS[color_name] if color_name != "Радужные" else None
+        self.decay_factor = config.get('decay_factor', self.DECAY_FACTOR)
+        self.border_radius = config.get('border_radius', self.BORDER_RADIUS)
+        self.use_caps = config.get('use_caps', self.USE_CAPS)
+        self.cap_decay_factor = config.get('cap_decay_factor', self.CAP_DECAY_FACTOR)
+        self.debug_output = config.get('debug_output', self.DEBUG_OUTPUT)
+        self.freq_scale = config.get('freq_scale', self.FREQ_SCALE)
+        if self.freq_scale not in self.FREQ_SCALES.values():
+            self.freq_scale = self.FREQ_SCALE
+        self.f_min = config.get('f_min', None)
+        self.f_max = config.get('f_max', None)
+        self.channel_mode = config.get('channel_mode', self.channel_mode)
+        if self.channel_mode not in self.CHANNEL_MODES.values():
+            self.channel_mode = "mono"
+        self.extra_devices = [int(d) for d in config.get('extra_devices', [])]
+        self.layout = config.get('layout', self.layout)
+        if self.layout not in self.LAYOUTS.values():
+            self.layout = "mirrored"
+        self.visual_mode = config.get('visual_mode', self.visual_mode)
+        if self.visual_mode not in self.VISUAL_MODES.values():
+            self.visual_mode = "bars"
+        self.feed_ring = config.get('feed_ring', None)
+        self.feed_targets = list(config.get('feed_targets', []))
+        self.feed_rate = max(0.0, float(config.get('feed_rate', 0.0)))
+        self.feed_coalesce = config.get('feed_coalesce', True)
+        self.record_file = config.get('record_file', None)
+        self.replay_file = config.get('replay_file', None)
+        self.replay_realtime = config.get('replay_realtime', True)
+        self.metrics.dump_file = config.get('metrics_file', None)
+        self.metrics.interval = config.get('metrics_interval', self.metrics.interval)
 
     def load_config(self):
         if os.path.exists(self.config_file):
             try:
                 with open(self.config_file, 'r', encoding='utf-8') as f:
                     config = json.load(f)
-                    self.current_device = config.get('device', None)
-                    self.current_bars = config.get('bars', self.BARS)
-                    self.current_scale = config.get('scale', self.SCALE)
-                    self.AUTO_SCALE = config.get('auto_scale', self.AUTO_SCALE)
-                    color_name = config.get('color', 'Циан')
-                    self.current_color = self.COLORS[color_name] if color_name != "Радужные" else None
-                    self.decay_factor = config.get('decay_factor', self.DECAY_FACTOR)
-                    self.border_radius = config.get('border_radius', self.BORDER_RADIUS)
-                    self.use_caps = config.get('use_caps', self.USE_CAPS)
-                    self.cap_decay_factor = config.get('cap_decay_factor', self.CAP_DECAY_FACTOR)
-                    self.debug_output = config.get('debug_output', self.DEBUG_OUTPUT)
+                    self.apply_config(config)
                     print(f"Настройки загружены из {self.config_file}: {config}")
-                    if self.console:
-                        self.console.insert(tk.END, f"Configuration loaded from {self.config_file}\n")
+                    self.console.log(f"Configuration loaded from {self.config_file}")
             except Exception as e:
                 print(f"Ошибка загрузки конфигурации из {self.config_file}: {e}")
-                if self.console:
-                    self.console.insert(tk.END, f"Failed to load config: {str(e)}\n")
+                self.console.log(f"Failed to load config: {str(e)}")
         else:
             print(f"Файл {self.config_file} не найден, используются настройки по умолчанию")
-            if self.console:
-                self.console.insert(tk.END, f"Configuration file {self.config_file} not found, using defaults\n")
+            self.console.log(f"Configuration file {self.config_file} not found, using defaults")
+
+    def query_input_devices(self):
+        # Устройства ввода PortAudio: [(индекс, имя)]. Может занимать секунды при множестве конечных точек
+        sd = load_sounddevice()
+        return [(i, dev['name']) for i, dev in enumerate(sd.query_devices()) if dev['max_input_channels'] > 0]
+
+    def set_live(self, name, value):
+        # Слайдеры и флажки GUI действуют сразу, в том числе на запущенные процессы
+        setattr(self, name, value)
+        if self.pipeline.running:
+            self.pipeline.update(self.config_dict())
 
     def create_gui(self):
         try:
+            self.startup.mark("импорт")
             root = tk.Tk()
+            self.startup.mark("Tk")
             root.title("Настройки визуализатора")
-            root.geometry("300x700")
+            root.geometry("300x1070")
 
             # Консоль для вывода сообщений
-            self.console = tk.Text(root, height=5, width=30)
-            self.console.pack(pady=5)
+            console = tk.Text(root, height=5, width=30)
+            console.pack(pady=5)
+            self.console.attach(console, root)
 
             # Загрузка настроек
             self.load_config()
+            self.startup.mark("настройки")
 
+            # Список устройств сначала из кэша в config.json; перебор PortAudio идёт в фоне
             tk.Label(root, text="Выберите микрофон:").pack(pady=5)
-            try:
-                devices = sd.query_devices()
-                input_devices = [(i, dev['name']) for i, dev in enumerate(devices) if dev['max_input_channels'] > 0]
-                if self.debug_output:
-                    print("Доступные устройства ввода:", input_devices)
-            except Exception as e:
-                self.console.insert(tk.END, f"Не удалось получить список устройств: {e}\n")
-                root.destroy()
-                return
+            self.device_var = tk.StringVar()
+            device_menu = ttk.Combobox(root, textvariable=self.device_var, state="readonly")
+            device_menu.pack(pady=5)
 
-            if not input_devices:
-                self.console.insert(tk.END, "Микрофоны не найдены. Проверьте настройки звука.\n")
-                root.destroy()
-                return
+            def show_devices():
+                names = [name for _, name in self.input_devices]
+                device_menu['values'] = names
+                if self.device_var.get() in names:
+                    return
+                saved = [name for i, name in self.input_devices if i == self.current_device]
+                self.device_var.set(saved[0] if saved else names[0] if names else "")
+
+            devices_found = queue.Queue()  # Результат фонового перебора для потока Tk
 
-            device_names = [name for _, name in input_devices]
-            self.device_var = tk.StringVar(value=device_names[0] if device_names else "")
-            if self.current_device is not None:
+            def find_devices():
+                started = time.perf_counter()
                 try:
-                    self.device_var.set(next(name for i, name in input_devices if i == self.current_device))
-                except StopIteration:
-                    pass
-            device_menu = ttk.Combobox(root, textvariable=self.device_var, values=device_names, state="readonly")
-            device_menu.pack(pady=5)
+                    devices_found.put((self.query_input_devices(), time.perf_counter() - started))
+                except Exception as e:
+                    devices_found.put((e, time.perf_counter() - started))
+
+            def update_devices(devices, elapsed):
+                if isinstance(devices, Exception):
+                    self.console.log(f"Не удалось получить список устройств: {devices}")
+                    return
+                if self.debug_output:
+                    print("Доступные устройства ввода:", devices)
+                print(f"Список устройств обновлён за {elapsed * 1000:.0f} мс: {len(devices)}")
+                self.console.log(f"Devices refreshed in {elapsed * 1000:.0f} ms: {len(devices)}")
+                if not devices:
+                    self.console.log("Микрофоны не найдены. Проверьте настройки звука.")
+                if devices != self.input_devices:
+                    self.input_devices = devices
+                    show_devices()
+                    self.save_config()
+
+            show_devices()
+            threading.Thread(target=find_devices, name="devices", daemon=True).start()
+
+            tk.Label(root, text="Каналы:").pack(pady=5)
+            self.channel_mode_var = tk.StringVar(value=next(k for k, v in self.CHANNEL_MODES.items()
+                                                            if v == self.channel_mode))
+            ttk.Combobox(root, textvariable=self.channel_mode_var, values=list(self.CHANNEL_MODES.keys()),
+                         state="readonly").pack(pady=5)
+            tk.Label(root, text="Доп. устройства (индексы через запятую):").pack(pady=5)
+            self.extra_devices_entry = tk.Entry(root)
+            self.extra_devices_entry.insert(0, ", ".join(str(d) for d in self.extra_devices))
+            self.extra_devices_entry.pack(pady=5)
+            self.layout_var = tk.StringVar(value=next(k for k, v in self.LAYOUTS.items() if v == self.layout))
+            ttk.Combobox(root, textvariable=self.layout_var, values=list(self.LAYOUTS.keys()),
+                         state="readonly").pack(pady=5)
+
+            tk.Label(root, text="Вид:").pack(pady=5)
+            self.visual_mode_var = tk.StringVar(value=next(k for k, v in self.VISUAL_MODES.items()
+                                                           if v == self.visual_mode))
+            ttk.Combobox(root, textvariable=self.visual_mode_var, values=list(self.VISUAL_MODES.keys()),
+                         state="readonly").pack(pady=5)
 
             tk.Label(root, text="Количество баров (10-100):").pack(pady=5)
             self.bars_entry = tk.Entry(root)
@@ -363,6 +813,23 @@ class AudioVisualizer:
             self.auto_scale_var = tk.BooleanVar(value=self.AUTO_SCALE)
             tk.Checkbutton(root, text="Автоматическая чувствительность", variable=self.auto_scale_var).pack(pady=5)
 
+            tk.Label(root, text="Шкала частот:").pack(pady=5)
+            self.freq_scale_var = tk.StringVar(value=next(k for k, v in self.FREQ_SCALES.items()
+                                                          if v == self.freq_scale))
+            ttk.Combobox(root, textvariable=self.freq_scale_var, values=list(self.FREQ_SCALES.keys()),
+                         state="readonly").pack(pady=5)
+
+            tk.Label(root, text="Диапазон частот, Гц (пусто — по умолчанию):").pack(pady=5)
+            freq_frame = tk.Frame(root)
+            freq_frame.pack(pady=5)
+            self.f_min_entry = tk.Entry(freq_frame, width=8)
+            self.f_min_entry.insert(0, "" if self.f_min is None else str(self.f_min))
+            self.f_min_entry.pack(side=tk.LEFT)
+            tk.Label(freq_frame, text="–").pack(side=tk.LEFT)
+            self.f_max_entry = tk.Entry(freq_frame, width=8)
+            self.f_max_entry.insert(0, "" if self.f_max is None else str(self.f_max))
+            self.f_max_entry.pack(side=tk.LEFT)
+
             tk.Label(root, text="Цвет баров:").pack(pady=5)
             self.color_var = tk.StringVar(value="Циан")
             if self.current_color is None:
@@ -378,13 +845,13 @@ class AudioVisualizer:
 
             tk.Label(root, text="Плавность угасания баров (0.0-0.9):").pack(pady=5)
             self.decay_scale = tk.Scale(root, from_=0.0, to=0.9, resolution=0.1, orient=tk.HORIZONTAL,
-                                        command=lambda val: setattr(self, 'decay_factor', float(val)))
+                                        command=lambda val: self.set_live('decay_factor', float(val)))
             self.decay_scale.set(self.decay_factor)
             self.decay_scale.pack(pady=5)
 
             tk.Label(root, text="Скругление баров (0-20):").pack(pady=5)
             self.radius_scale = tk.Scale(root, from_=0, to=20, resolution=1, orient=tk.HORIZONTAL,
-                                         command=lambda val: setattr(self, 'border_radius', int(val)))
+                                         command=lambda val: self.set_live('border_radius', int(val)))
             self.radius_scale.set(self.border_radius)
             self.radius_scale.pack(pady=5)
 
@@ -394,14 +861,21 @@ class AudioVisualizer:
 
             tk.Label(root, text="Плавность угасания крышек (0.0-0.9):").pack(pady=5)
             self.cap_decay_scale = tk.Scale(root, from_=0.0, to=0.9, resolution=0.1, orient=tk.HORIZONTAL,
-                                            command=lambda val: setattr(self, 'cap_decay_factor', float(val)))
+                                            command=lambda val: self.set_live('cap_decay_factor', float(val)))
             self.cap_decay_scale.set(self.cap_decay_factor)
             self.cap_decay_scale.pack(pady=5)
 
+            self.adaptive_var = tk.BooleanVar(value=self.adaptive_quality)
+            tk.Checkbutton(root, text="Адаптивное качество", variable=self.adaptive_var,
+                           command=lambda: self.set_live('adaptive_quality', self.adaptive_var.get())).pack(pady=5)
+            self.beat_flash_var = tk.BooleanVar(value=self.beat_flash)
+            tk.Checkbutton(root, text="Вспышки на долях", variable=self.beat_flash_var,
+                           command=lambda: self.set_live('beat_flash', self.beat_flash_var.get())).pack(pady=5)
+
             tk.Label(root, text="Отладочный вывод:").pack(pady=5)
             self.debug_var = tk.BooleanVar(value=self.debug_output)
             tk.Checkbutton(root, text="Включить отладочный вывод", variable=self.debug_var,
-                           command=lambda: setattr(self, 'debug_output', self.debug_var.get())).pack(pady=5)
+                           command=lambda: self.set_live('debug_output', self.debug_var.get())).pack(pady=5)
 
             def start_visualizer():
                 try:
@@ -413,47 +887,83 @@ class AudioVisualizer:
                         if not 0.1 <= self.current_scale <= 5:
                             raise ValueError("Чувствительность должна быть от 0.1 до 5")
                     self.AUTO_SCALE = self.auto_scale_var.get()
+                    self.freq_scale = self.FREQ_SCALES[self.freq_scale_var.get()]
+                    self.channel_mode = self.CHANNEL_MODES[self.channel_mode_var.get()]
+                    self.layout = self.LAYOUTS[self.layout_var.get()]
+                    self.visual_mode = self.VISUAL_MODES[self.visual_mode_var.get()]
+                    extra = self.extra_devices_entry.get().replace(",", " ").split()
+                    self.extra_devices = [int(d) for d in extra]
+                    if self.channel_mode == "devices" and not self.extra_devices:
+                        raise ValueError("Укажите дополнительные устройства для режима нескольких устройств")
+                    f_min, f_max = self.f_min_entry.get().strip(), self.f_max_entry.get().strip()
+                    self.f_min = float(f_min) if f_min else None
+                    self.f_max = float(f_max) if f_max else None
+                    if self.f_min is not None and self.f_max is not None and not 0 <= self.f_min < self.f_max:
+                        raise ValueError("Нижняя частота должна быть меньше верхней")
                     self.use_caps = self.cap_var.get()
                     self.debug_output = self.debug_var.get()
                     color_name = self.color_var.get()
                     self.current_color = self.COLORS[color_name] if color_name != "Радужные" else None
-                    device_name = self.device_var.get()
-                    self.current_device = next(i for i, name in input_devices if name == device_name)
+                    # При воспроизведении записи устройство берётся из неё, и звуковая карта не нужна
+                    if not self.replay_file:
+                        device_name = self.device_var.get()
+                        found = [i for i, name in self.input_devices if name == device_name]
+                        if not found:
+                            raise ValueError(f"Устройство ввода не найдено: {device_name or 'не выбрано'}")
+                        self.current_device = found[0]
                     self.save_config()
-                    data_queue = queue.Queue()
-                    threading.Thread(target=self.microphone_source, args=(data_queue, self.current_device),
-                                     daemon=True).start()
+                    settings = self.config_dict()
+                    if self.replay_file:
+                        # Параметры захвата из записи нужны обоим процессам и размеру разделяемого буфера,
+                        # но в config.json остаются настройки пользователя
+                        from recorder import read_info, session_settings
+                        settings.update(session_settings(read_info(self.replay_file)))
+                    if self.pipeline.needs_restart(settings):
+                        self.pipeline.start(settings, self.source_count(settings))
+                    else:
+                        # Захват уже идёт с тем же устройством: настройки применяются на лету
+                        self.pipeline.update(settings)
                 except ValueError as e:
-                    self.console.insert(tk.END, f"Ошибка: {str(e)}\n")
+                    self.console.log(f"Ошибка: {str(e)}")
+                except OSError as e:
+                    self.console.log(f"Ошибка чтения записи {self.replay_file}: {e}")
                 except Exception as e:
-                    self.console.insert(tk.END, f"Ошибка при выборе устройства: {str(e)}\n")
+                    self.console.log(f"Ошибка при выборе устройства: {str(e)}")
 
             tk.Button(root, text="Запустить визуализатор", command=start_visualizer).pack(pady=10)
 
             def toggle_borderless():
+                # Окно принадлежит процессу отрисовки, режим переключается командой
                 self.borderless = not self.borderless
-                try:
-                    if self.borderless:
-                        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height), pygame.NOFRAME)
-                        pygame.display.set_caption("Аудиовизуализатор (Безрамочный)")
-                        print(f"Переключение в безрамочный режим: {self.screen_width}x{self.screen_height}")
-                        self.console.insert(tk.END,
-                                            f"Switched to borderless mode: {self.screen_width}x{self.screen_height}\n")
-                    else:
-                        self.screen = pygame.display.set_mode((self.WIDTH, self.HEIGHT), pygame.RESIZABLE)
-                        pygame.display.set_caption("Аудиовизуализатор (Микрофон)")
-                        print(f"Переключение в оконный режим: {self.WIDTH}x{self.HEIGHT}")
-                        self.console.insert(tk.END, f"Switched to windowed mode: {self.WIDTH}x{self.HEIGHT}\n")
-                except Exception as e:
-                    print(f"Ошибка переключения режима: {e}")
-                    self.console.insert(tk.END, f"Ошибка переключения режима: {e}\n")
+                self.pipeline.send('borderless')
 
             tk.Button(root, text="Безрамочный режим (F11, Esc)", command=toggle_borderless).pack(pady=10)
 
+            def pump_events():
+                # Сообщения процессов и список устройств выводятся из потока Tk
+                while not devices_found.empty():
+                    update_devices(*devices_found.get_nowait())
+                for kind, payload in self.pipeline.poll():
+                    if kind == 'log':
+                        for line in payload.splitlines():
+                            self.console.log(line)
+                    elif kind == 'stopped':
+                        self.pipeline.stop()
+                root.after(100, pump_events)
+
+            def close():
+                self.pipeline.stop()
+                root.destroy()
+
+            pump_events()
+            root.protocol("WM_DELETE_WINDOW", close)
+            self.startup.mark("окно настроек")
+            print(f"Запуск GUI: {self.startup.summary()}")
+            self.console.log(f"Запуск GUI: {self.startup.summary()}")
             root.mainloop()
         except Exception as e:
             print(f"Ошибка в create_gui: {e}")
-            self.console.insert(tk.END, f"Не удалось создать GUI: {e}\n") if self.console else None
+            self.console.log(f"Не удалось создать GUI: {e}")
 
 
 def main():
@@ -463,9 +973,8 @@ def main():
     except Exception as e:
         print(f"Ошибка в main: {e}")
         messagebox.showerror("Ошибка", f"Критическая ошибка: {e}")
-    finally:
-        pygame.quit()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
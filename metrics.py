@@ -0,0 +1,201 @@
+import bisect
+import json
+import time
+
+STAGES = ("wait", "fft", "binning", "decay", "onset", "draw", "flip", "latency")
+STATUS_FLAGS = ("input_overflow", "input_underflow", "output_overflow", "output_underflow", "priming_output")
+
+
+class Histogram:
+    # Гистограмма длительностей с фиксированными логарифмическими корзинами (1 мкс – 1 с):
+    # постоянная память, запись — один bisect по списку
+    EDGES = [10 ** (i / 10 - 6) for i in range(61)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.EDGES) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.last = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect(self.EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, q):
+        # Верхняя граница корзины, в которую попадает q-й перцентиль
+        if not self.count:
+            return 0.0
+        target = self.count * q / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.EDGES[min(index, len(self.EDGES) - 1)], self.maximum)
+        return self.maximum
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'last_ms': self.last * 1000,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.maximum * 1000,
+        }
+
+
+class Metrics:
+    # Таймеры стадий, счётчики и показатели без вывода в консоль на каждом кадре.
+    # Сводка пишется в лог не чаще interval секунд и, при необходимости, в JSON-файл.
+    def __init__(self, interval=5.0, dump_file=None, log=print):
+        self.stages = {name: Histogram() for name in STAGES}
+        self.counters = {name: 0 for name in STATUS_FLAGS}
+        self.counters['xruns'] = 0
+        self.gauges = {}
+        self.interval = interval
+        self.dump_file = dump_file
+        self.log = log
+        self.log_enabled = False
+        self._last_report = time.perf_counter()
+
+    def record(self, stage, seconds):
+        self.stages[stage].record(seconds)
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def status(self, flags):
+        # Флаги sounddevice.CallbackFlags; вызывается из callback только при ненулевом статусе
+        self.counters['xruns'] += 1
+        for name in STATUS_FLAGS:
+            if getattr(flags, name, False):
+                self.counters[name] += 1
+
+    def snapshot(self, extra=None):
+        data = {
+            'time': time.time(),
+            'stages': {name: hist.summary() for name, hist in self.stages.items()},
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+        }
+        if extra:
+            data.update(extra)
+        return data
+
+    def summary_line(self, extra=None):
+        s = self.stages
+        line = (f"fft {s['fft'].percentile(50) * 1000:.3f} мс, бины {s['binning'].percentile(50) * 1000:.3f} мс, "
+                f"отрисовка p95 {s['draw'].percentile(95) * 1000:.2f} мс, "
+                f"задержка {s['latency'].last * 1000:.1f} мс, xruns {self.counters['xruns']}")
+        if extra:
+            line = f"FPS {extra.get('fps', 0):.1f}, кадр p95 {extra.get('frame_ms_p95', 0):.1f} мс, " \
+                   f"пропущено {extra.get('dropped', 0)}, " + line
+        return line
+
+    def tick(self, extra=None):
+        # Периодический отчёт; между отчётами стоит одно сравнение времени.
+        # extra — функция, возвращающая дополнительные показатели (вызывается только при отчёте)
+        now = time.perf_counter()
+        if now - self._last_report < self.interval:
+            return False
+        self._last_report = now
+        extra = extra() if extra else None
+        if self.log_enabled:
+            self.log(self.summary_line(extra))
+        self.dump(extra)
+        return True
+
+    def dump(self, extra=None):
+        if not self.dump_file:
+            return
+        try:
+            with open(self.dump_file, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(extra), f, indent=4)
+        except OSError as e:
+            self.log(f"Не удалось записать метрики в {self.dump_file}: {e}")
+            self.dump_file = None
+
+
+class Overlay:
+    # Экранная панель метрик; текст перерисовывается несколько раз в секунду,
+    # в остальных кадрах готовая поверхность только копируется на экран
+    def __init__(self, refresh=0.25, size=16):
+        import pygame  # Только в процессе отрисовки; шрифты инициализируются при первой панели
+        if not pygame.font.get_init():
+            pygame.font.init()
+        self.refresh = refresh
+        self.font = pygame.font.Font(None, size)
+        self.surface = None
+        self._updated = 0.0
+
+    def update(self, metrics, extra=None):
+        now = time.perf_counter()
+        if self.surface is not None and now - self._updated < self.refresh:
+            return
+        self._updated = now
+        lines = self.lines(metrics, extra() if extra else None)
+        rendered = [self.font.render(line, True, (255, 255, 255)) for line in lines]
+        # Панель не сжимается, чтобы на экране не оставались следы прежнего текста
+        width = max(r.get_width() for r in rendered) + 8
+        height = sum(r.get_height() for r in rendered) + 8
+        if self.surface is not None:
+            width, height = max(width, self.surface.get_width()), max(height, self.surface.get_height())
+        if self.surface is None or self.surface.get_size() != (width, height):
+            import pygame
+            self.surface = pygame.Surface((width, height))
+        self.surface.fill((20, 20, 20))
+        y = 4
+        for r in rendered:
+            self.surface.blit(r, (4, y))
+            y += r.get_height()
+
+    def draw(self, screen, bottom=False):
+        if self.surface is None:
+            return None
+        y = screen.get_height() - self.surface.get_height() if bottom else 0
+        return screen.blit(self.surface, (0, y))
+
+    @staticmethod
+    def lines(metrics, extra=None):
+        s = metrics.stages
+        result = []
+        if extra:
+            result.append(f"FPS {extra.get('fps', 0):.1f}  p95 {extra.get('frame_ms_p95', 0):.1f} ms  "
+                          f"dropped {extra.get('dropped', 0)}")
+        for name in ("fft", "binning", "decay", "onset", "draw", "flip", "wait"):
+            hist = s[name]
+            result.append(f"{name:8s} p50 {hist.percentile(50) * 1000:6.2f}  p95 {hist.percentile(95) * 1000:6.2f} ms")
+        result.append(f"latency {s['latency'].last * 1000:.1f} ms  queue {metrics.gauges.get('queue_depth', 0)}  "
+                      f"xruns {metrics.counters['xruns']}")
+        g = metrics.gauges
+        result.append(f"tempo {g.get('tempo', 0):.0f} bpm ({g.get('tempo_confidence', 0):.0%})  "
+                      f"onsets {g.get('onsets', 0)}  scale {g.get('scale', 0):.2f}")
+        return result
+
+
+class StartupTimer:
+    # Длительности фаз запуска: каждая фаза — от предыдущей отметки. Отсчёт по time.time(),
+    # чтобы начало можно было передать в другой процесс (нажатие «Запустить» в GUI)
+    def __init__(self, origin=None):
+        self.origin = time.time() if origin is None else origin
+        self.last = self.origin
+        self.phases = []
+        self.finished = False
+
+    def mark(self, phase):
+        now = time.time()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def summary(self):
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f}" for phase, seconds in self.phases)
+        return f"{phases} (всего {(self.last - self.origin) * 1000:.0f} мс)"
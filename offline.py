@@ -0,0 +1,181 @@
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Без окна: рендер в память
+
+import numpy as np
+import pygame
+import soundfile as sf
+
+from renderer import BarRenderer
+from spectrum import SpectrumAnalyzer
+
+BLOCK_HOPS = 512  # Окон анализа в одном блоке чтения файла
+
+
+def load_visualizer(config_file=None):
+    # Настройки берутся из того же config.json, что и у живого визуализатора
+    from main import AudioVisualizer
+    visualizer = AudioVisualizer()
+    if config_file:
+        visualizer.config_file = os.path.abspath(config_file)
+    visualizer.load_config()
+    return visualizer
+
+
+def frame_count(path, hop):
+    return math.ceil(sf.info(path).frames / hop)
+
+
+def iter_windows(path, chunk, hop, start=0, stop=None):
+    # Потоковое чтение файла блоками; окно кадра k заканчивается на сэмпле (k + 1) * hop,
+    # как у FrameReader при живом захвате. Каналы сводятся в моно.
+    with sf.SoundFile(path) as f:
+        total = math.ceil(f.frames / hop)
+        stop = total if stop is None else min(stop, total)
+        for first in range(start, stop, BLOCK_HOPS):
+            last = min(first + BLOCK_HOPS, stop)
+            begin = (first + 1) * hop - chunk
+            end = last * hop
+            f.seek(max(0, begin))
+            block = f.read(end - max(0, begin), dtype='float32', always_2d=True, fill_value=0)
+            samples = block.mean(axis=1)
+            if begin < 0:
+                samples = np.concatenate([np.zeros(-begin, dtype=samples.dtype), samples])
+            windows = np.lib.stride_tricks.sliding_window_view(samples, chunk)[::hop]
+            yield first, windows[:last - first]
+
+
+def bin_range(path, output, settings, start, stop):
+    # Стадия без состояния: FFT и группировка по барам для кадров [start, stop).
+    # Пишет сырые амплитуды прямо в общий .npy, поэтому диапазоны считаются параллельно.
+    chunk, hop, bars, gain, fft_gain, rate, scale, f_min, f_max = settings
+    spectrum = SpectrumAnalyzer(chunk, rate, bars, gain, fft_gain, scale, f_min, f_max)
+    out = np.load(output, mmap_mode='r+')
+    for first, windows in iter_windows(path, spectrum.fft_size, hop, start, stop):
+        spectrum.bin_batch(windows, out[first:first + len(windows)])
+    out.flush()
+    return stop - start
+
+
+class OfflineRenderer:
+    # Обработка записанного файла с настройками визуализатора быстрее реального времени
+    def __init__(self, visualizer, size=(800, 600)):
+        self.visualizer = visualizer
+        self.size = size
+        self.scale = visualizer.current_scale  # Чувствительность из настроек; авто-масштаб меняет живое значение
+
+    def settings(self, rate):
+        v = self.visualizer
+        return v.CHUNK, v.HOP, v.current_bars, v.GAIN, v.FFT_GAIN, rate, v.freq_scale, v.f_min, v.f_max
+
+    def render(self, path, output, frames_dir=None, fps=None, workers=1):
+        v = self.visualizer
+        started = time.perf_counter()
+        # Каждый файл — с начального состояния авто-масштаба, независимо от обработанных до него
+        v.current_scale = v.last_scale = self.scale
+        v.band_stats = None
+        v.level = 0.0
+        info = sf.info(path)
+        settings = self.settings(info.samplerate)
+        total = frame_count(path, v.HOP)
+        bars = np.lib.format.open_memmap(output, mode='w+', dtype=np.float32, shape=(total, v.current_bars))
+        del bars
+
+        # Стадия 1: сырые амплитуды (параллельно по диапазонам кадров)
+        if workers > 1 and total > BLOCK_HOPS:
+            step = math.ceil(total / workers)
+            ranges = [(start, min(start + step, total)) for start in range(0, total, step)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(bin_range, *zip(*[(path, output, settings, a, b) for a, b in ranges])))
+        else:
+            bin_range(path, output, settings, 0, total)
+
+        # Стадия 2: угасание и крышки последовательно, состояние переходит через границы диапазонов
+        bars = np.load(output, mmap_mode='r+')
+        caps = None
+        if v.use_caps:
+            caps = np.lib.format.open_memmap(caps_path(output), mode='w+', dtype=np.float32, shape=bars.shape)
+        self.apply_decay(bars, caps, frames_dir, fps, info.samplerate)
+        bars.flush()
+        if caps is not None:
+            caps.flush()
+
+        elapsed = time.perf_counter() - started
+        duration = info.frames / info.samplerate
+        print(f"{path}: {total} кадров, {duration:.1f} с звука за {elapsed:.2f} с "
+              f"({duration / max(elapsed, 1e-9):.0f}x реального времени)")
+        return {'frames': total, 'duration': duration, 'elapsed': elapsed}
+
+    def apply_decay(self, bars, caps, frames_dir=None, fps=None, rate=None):
+        v = self.visualizer
+        rate = rate or v.RATE
+        spectrum = SpectrumAnalyzer(v.CHUNK, rate, v.current_bars, v.GAIN, v.FFT_GAIN, v.freq_scale, v.f_min, v.f_max)
+        surface = renderer = None
+        if frames_dir:
+            os.makedirs(frames_dir, exist_ok=True)
+            surface = pygame.Surface(self.size)
+            renderer = BarRenderer(v.current_bars, self.size, v.current_color, v.border_radius,
+                                   v.MIN_BAR_HEIGHT, v.MAX_BAR_HEIGHT)
+        hop_duration = v.HOP / rate
+        image_index = -1
+        for first in range(0, len(bars), BLOCK_HOPS):
+            block = bars[first:first + BLOCK_HOPS]
+            cap_block = caps[first:first + BLOCK_HOPS] if caps is not None else None
+            for k, row in enumerate(block):
+                magnitudes = spectrum.decay(row, v.decay_factor, v.use_caps, v.cap_decay_factor)
+                row[:] = magnitudes
+                if cap_block is not None:
+                    cap_block[k] = spectrum.cap_heights
+                if renderer is None:
+                    continue
+                if v.AUTO_SCALE:
+                    v.update_auto_scale(v.update_levels(magnitudes, 1 / hop_duration), self.size[1])
+                index = first + k
+                if fps:
+                    # Кадр изображения берётся при переходе к следующему интервалу 1 / fps
+                    next_index = int((index + 1) * hop_duration * fps)
+                    if next_index == image_index:
+                        continue
+                    image_index = next_index
+                else:
+                    image_index = index
+                renderer.draw(surface, magnitudes, spectrum.cap_heights if v.use_caps else None,
+                              v.current_scale, present=False)
+                pygame.image.save(surface, os.path.join(frames_dir, f"frame_{image_index:06d}.png"))
+
+
+def caps_path(output):
+    root, ext = os.path.splitext(output)
+    return f"{root}.caps{ext or '.npy'}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-анализ аудиофайлов с настройками визуализатора")
+    parser.add_argument("input", help="Аудиофайл (WAV, FLAC, ...)")
+    parser.add_argument("-o", "--output", help="Файл .npy с амплитудами баров (кадры x бары)")
+    parser.add_argument("--frames", help="Папка для PNG-кадров")
+    parser.add_argument("--fps", type=float, help="Частота PNG-кадров (по умолчанию каждый шаг анализа)")
+    parser.add_argument("--size", default="800x600", help="Размер PNG-кадров, например 1920x1080")
+    parser.add_argument("--workers", type=int, default=1, help="Количество процессов для длинных файлов")
+    parser.add_argument("--config", help="Путь к config.json")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.input)[0] + ".bars.npy"
+    size = tuple(int(x) for x in args.size.lower().split("x"))
+    try:
+        visualizer = load_visualizer(args.config)
+        visualizer.debug_output = False
+        OfflineRenderer(visualizer, size).render(args.input, output, args.frames, args.fps, args.workers)
+    except Exception as e:
+        print(f"Ошибка офлайн-анализа: {e}")
+        raise SystemExit(1)
+    finally:
+        pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import multiprocessing
+import queue
+import time
+
+from console import LogSink
+
+MAX_BARS = 100  # Ёмкость разделяемого буфера по барам (предел GUI)
+# Их смена требует перезапуска захвата
+CAPTURE_KEYS = ('device', 'channel_mode', 'extra_devices', 'rate', 'hop', 'feed_ring', 'feed_targets', 'feed_rate',
+                'feed_coalesce', 'record_file', 'replay_file', 'replay_realtime')
+
+
+class EventConsole(LogSink):
+    # Журнал процессов-исполнителей: циклы процессов вызывают flush, и накопленные строки
+    # уходят в очередь событий GUI одним сообщением. Повторы и лишние строки отсекаются
+    # ещё здесь, чтобы не забивать очередь
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+        self.output = self._send
+
+    def _send(self, lines):
+        self.events.put(('log', "\n".join(lines)))
+
+
+def _run_worker(role, settings, shared_info, control, events, started):
+    from main import AudioVisualizer
+    from metrics import StartupTimer
+    from shared import SharedSpectrum
+    visualizer = AudioVisualizer()
+    visualizer.startup = StartupTimer(started)  # Отсчёт от запуска конвейера в GUI
+    visualizer.console = EventConsole(events)
+    visualizer.apply_config(settings)
+    shared = SharedSpectrum(*shared_info)
+    try:
+        if role == 'analysis':
+            visualizer.capture_loop(settings['device'], shared, control)
+        else:
+            visualizer.render_loop(shared, control)
+    finally:
+        shared.close()
+        visualizer.console.flush(force=True)
+        events.put(('stopped', role))
+
+
+def analysis_main(settings, shared_info, control, events, started):
+    _run_worker('analysis', settings, shared_info, control, events, started)
+
+
+def render_main(settings, shared_info, control, events, started):
+    _run_worker('render', settings, shared_info, control, events, started)
+
+
+class Pipeline:
+    # Захват с анализом и отрисовка работают в отдельных процессах (каждый со своим GIL).
+    # Спектр передаётся через SharedSpectrum, настройки и команды — через очереди управления,
+    # сообщения для консоли GUI — через общую очередь событий.
+    def __init__(self):
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = []
+        self.controls = []
+        self.events = None
+        self.shared = None
+        self.settings = None
+        self._pending = []  # События остановленных процессов, ещё не отданные GUI
+
+    @property
+    def running(self):
+        return any(process.is_alive() for process in self.processes)
+
+    def start(self, settings, sources):
+        self.stop()
+        started = time.time()
+        from shared import SharedSpectrum  # numpy нужен GUI только с запуском конвейера
+        bars = max(MAX_BARS, settings.get('bars', 0))
+        self.shared = SharedSpectrum(sources, bars)
+        self.events = self.context.Queue()
+        for target in (analysis_main, render_main):
+            control = self.context.Queue()
+            process = self.context.Process(target=target, daemon=True,
+                                           args=(settings, (sources, bars, self.shared.name), control, self.events,
+                                                 started))
+            process.start()
+            self.controls.append(control)
+            self.processes.append(process)
+        self.settings = dict(settings)
+
+    def needs_restart(self, settings):
+        return not self.running or any(self.settings.get(key) != settings.get(key) for key in CAPTURE_KEYS)
+
+    def update(self, settings):
+        self.send('settings', settings)
+        self.settings = dict(settings)
+
+    def send(self, kind, payload=None):
+        for control in self.controls:
+            control.put((kind, payload))
+
+    def poll(self):
+        # Накопленные события без блокировки; ('stopped', роль) означает завершение процесса
+        messages, self._pending = self._pending, []
+        while self.events is not None:
+            try:
+                messages.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def stop(self, timeout=2.0):
+        if not self.processes:
+            return
+        self.send('stop')
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        # Последние сообщения остановленных процессов, кроме уведомлений об остановке
+        messages = self.poll()
+        self._pending = [message for message in messages if message[0] != 'stopped']
+        self.shared.close()
+        self.shared = None
+        self.processes, self.controls = [], []
@@ -0,0 +1,276 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from metrics import STATUS_FLAGS
+
+# Файл сессии: заголовок HEADER_SIZE байт (magic, версия, длина JSON, JSON с параметрами захвата),
+# затем записи подряд: RECORD и float32 сэмплы (кадры x каналы). Нулевая запись — конец данных.
+MAGIC = b"AVRC"
+VERSION = 1
+HEADER_SIZE = 4096
+HEADER = struct.Struct("<4sII")
+RECORD = struct.Struct("<IHHdd")  # Кадры, поток (устройство), флаги статуса, время от начала, время АЦП
+SEGMENT = 1 << 25  # Шаг роста файла, байт
+
+
+def status_bits(status):
+    # Флаги sounddevice.CallbackFlags -> битовая маска в порядке STATUS_FLAGS
+    bits = 0
+    for i, name in enumerate(STATUS_FLAGS):
+        if getattr(status, name, False):
+            bits |= 1 << i
+    return bits
+
+
+class ReplayStatus:
+    # Флаги статуса из записи с тем же интерфейсом, что у sounddevice.CallbackFlags
+    def __init__(self, bits):
+        self.bits = bits
+        for i, name in enumerate(STATUS_FLAGS):
+            setattr(self, name, bool(bits & (1 << i)))
+
+    def __bool__(self):
+        return bool(self.bits)
+
+
+class ReplayTime:
+    def __init__(self, adc_time):
+        self.inputBufferAdcTime = adc_time
+        self.currentTime = adc_time
+
+
+def read_info(path):
+    with open(path, 'rb') as f:
+        magic, version, length = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: не файл сессии")
+        return json.loads(f.read(length).decode('utf-8'))
+
+
+class SessionRecorder:
+    # Запись блоков захвата в файл, отображённый в память, прямо из callback драйвера:
+    # на блок — упаковка заголовка записи и одно копирование сэмплов. Файл растёт сегментами
+    # по SEGMENT байт, при закрытии обрезается до записанного и получает итоговый заголовок.
+    def __init__(self, path, info):
+        self.path = path
+        self.info = dict(info)
+        self.channels = info['channels']
+        self.records = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()  # Несколько устройств пишут из своих потоков
+        self._file = open(path, 'w+b')
+        self._file.truncate(HEADER_SIZE + SEGMENT)
+        self._map = mmap.mmap(self._file.fileno(), HEADER_SIZE + SEGMENT)
+        self._write_header()
+        self.position = HEADER_SIZE
+
+    def _write_header(self):
+        data = json.dumps(self.info).encode('utf-8')
+        if HEADER.size + len(data) > HEADER_SIZE:
+            raise ValueError("Слишком большой заголовок сессии")
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, len(data))
+        self._map[HEADER.size:HEADER.size + len(data)] = data
+
+    def write(self, stream, indata, status=None, time_info=None):
+        block = np.ascontiguousarray(indata, dtype=np.float32)
+        frames = len(block)
+        payload = block.nbytes
+        adc_time = getattr(time_info, 'inputBufferAdcTime', 0.0) if time_info is not None else 0.0
+        with self._lock:
+            position = self.position
+            end = position + RECORD.size + payload
+            if end + RECORD.size > len(self._map):
+                self._map.resize(len(self._map) + max(SEGMENT, end - len(self._map) + RECORD.size))
+            # Сначала данные, затем заголовок: при обрыве записи недописанный блок не читается
+            self._map[position + RECORD.size:end] = memoryview(block).cast('B')
+            RECORD.pack_into(self._map, position, frames, stream, status_bits(status) if status else 0,
+                             time.perf_counter() - self.started, adc_time)
+            self.position = end
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self.info['records'] = self.records
+            self.info['duration'] = time.perf_counter() - self.started
+            self._write_header()
+            self._map.flush()
+            self._map.close()
+            self._file.truncate(self.position + RECORD.size)  # Нулевая запись в конце
+            self._file.close()
+
+
+class SessionReader:
+    # Последовательное чтение записей; блоки — представления отображённого файла
+    def __init__(self, path):
+        self.info = read_info(path)
+        self.channels = self.info['channels']
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        position = HEADER_SIZE
+        size = len(self._map)
+        while position + RECORD.size <= size:
+            frames, stream, bits, elapsed, adc_time = RECORD.unpack_from(self._map, position)
+            if frames == 0:
+                break
+            position += RECORD.size
+            block = np.frombuffer(self._map, np.float32, frames * self.channels, position)
+            yield elapsed, stream, bits, adc_time, block.reshape(frames, self.channels)
+            position += frames * self.channels * 4
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # Последний блок ещё используется; отображение освободится вместе с ним
+        self._file.close()
+
+
+class SessionReplay:
+    # Источник захвата из записи: блоки передаются тем же callback, что и у sd.InputStream.
+    # realtime — отдельный поток с исходными интервалами между блоками (как живое устройство);
+    # иначе блоки подаются синхронно через pump(), по шагу основного устройства за вызов,
+    # и прогон детерминирован: каждый блок анализируется ровно один раз.
+    def __init__(self, path, realtime=True):
+        self.path = path
+        self.reader = SessionReader(path)
+        self.info = self.reader.info
+        self.realtime = realtime
+        self.latency = self.info.get('latency', 0.0)
+        self.finished = False
+        self.blocks = 0
+        self._records = iter(self.reader)
+        self._callbacks = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, callbacks):
+        self._callbacks = callbacks
+        if self.realtime:
+            self._thread = threading.Thread(target=self._run, name="replay", daemon=True)
+            self._thread.start()
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _dispatch(self, record):
+        elapsed, stream, bits, adc_time, block = record
+        self._callbacks[stream](block, len(block), ReplayTime(adc_time), ReplayStatus(bits))
+        self.blocks += 1
+        return stream
+
+    def _run(self):
+        started = time.perf_counter()
+        for record in self._records:
+            delay = started + record[0] - time.perf_counter()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            self._dispatch(record)
+        self.finished = True
+
+    def pump(self):
+        # Синхронная подача до следующего блока основного устройства; False — запись закончилась
+        if self.realtime:
+            return not self.finished
+        for record in self._records:
+            if self._dispatch(record) == 0:
+                return True
+        self.finished = True
+        return False
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+        self._records = None
+        self.reader.close()
+
+
+def session_settings(info):
+    # Параметры конфигурации, которые должны совпадать с записью
+    devices = info.get('devices', [0])
+    return {'rate': info['rate'], 'hop': info['hop'], 'channel_mode': info['channel_mode'], 'device': devices[0],
+            'extra_devices': devices[1:]}
+
+
+def run_replay(path, fast=False, config_file=None, metrics_file=None):
+    # Прогон записи через процессы анализа и отрисовки без GUI; сводка метрик — в консоль и JSON
+    from main import AudioVisualizer
+    visualizer = AudioVisualizer()
+    if config_file:
+        visualizer.config_file = os.path.abspath(config_file)
+    visualizer.load_config()
+    settings = visualizer.config_dict()
+    settings.update(session_settings(read_info(path)))
+    settings.update(replay_file=os.path.abspath(path), replay_realtime=not fast, record_file=None)
+    if metrics_file:
+        settings['metrics_file'] = os.path.abspath(metrics_file)
+    visualizer.apply_config(settings)
+    pipeline = visualizer.pipeline
+    started = time.perf_counter()
+    pipeline.start(settings, visualizer.source_count())
+    try:
+        stopped = False
+        while not stopped:
+            alive = pipeline.running  # До опроса: сообщения завершившихся процессов уже в очереди
+            for kind, payload in pipeline.poll():
+                stopped = stopped or kind == 'stopped'
+            if not stopped and not alive:
+                # Процессы завершились, не успев сообщить об этом (убиты, упали при запуске)
+                print("Процессы анализа и отрисовки завершились без уведомления")
+                break
+            time.sleep(0.05)
+    finally:
+        pipeline.stop()
+    print(f"Прогон записи занял {time.perf_counter() - started:.2f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Записи сессий захвата: сведения и воспроизведение")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="Параметры и статистика записи")
+    info.add_argument("path")
+    replay = sub.add_parser("replay", help="Прогнать запись через анализ и отрисовку")
+    replay.add_argument("path")
+    replay.add_argument("--fast", action="store_true", help="Без пауз между блоками (каждый блок анализируется)")
+    replay.add_argument("--headless", action="store_true", help="Без окна (SDL dummy)")
+    replay.add_argument("--metrics", help="Записать итоговые метрики в JSON")
+    replay.add_argument("--config", help="Путь к config.json")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        reader = SessionReader(args.path)
+        counts = {}
+        flagged = 0
+        last = 0.0
+        block = None
+        for elapsed, stream, bits, _, block in reader:
+            counts[stream] = counts.get(stream, 0) + len(block)
+            flagged += bool(bits)
+            last = elapsed
+        del block
+        reader.close()
+        print(json.dumps(reader.info, indent=4, ensure_ascii=False))
+        for stream, frames in sorted(counts.items()):
+            print(f"Поток {stream}: {frames} сэмплов ({frames / reader.info['rate']:.1f} с)")
+        print(f"Длительность {last:.1f} с, блоков с флагами статуса: {flagged}")
+    else:
+        if args.headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+        run_replay(args.path, args.fast, args.config, args.metrics)
+
+
+if __name__ == "__main__":
+    main()
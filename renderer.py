@@ -0,0 +1,325 @@
+import math
+import time
+
+import numpy as np
+import pygame
+
+BACKGROUND = (0, 0, 0)
+CAP_GAP = 5  # Зазор между баром и крышкой
+CAP_COLOR = (255, 255, 255)  # Цвет крышек при однотонных барах
+
+
+def rainbow_palette(count):
+    # Векторный HSV -> RGB для s = v = 1 (аналог colorsys.hsv_to_rgb)
+    h = np.arange(count) / count * 6.0
+    i = np.floor(h).astype(int) % 6
+    f = h - np.floor(h)
+    q = 1.0 - f
+    ones = np.ones(count)
+    zeros = np.zeros(count)
+    r = np.choose(i, [ones, q, zeros, zeros, f, ones])
+    g = np.choose(i, [f, ones, ones, q, zeros, zeros])
+    b = np.choose(i, [zeros, zeros, f, ones, ones, q])
+    return (np.stack([r, g, b], axis=1) * 255).astype(int)
+
+
+class BarRenderer:
+    # Геометрия, палитра и спрайты баров строятся один раз для набора
+    # (бары, размер окна, цвет, скругление). Каждый кадр перерисовываются
+    # только изменившиеся столбцы, экран обновляется по грязным прямоугольникам.
+    def __init__(self, bars, size, color, border_radius=0, min_height=10, max_height=0.8, reverse=False):
+        self.key = (bars, tuple(size), color, border_radius, min_height, max_height)
+        self.reverse = reverse
+        self.bars = bars
+        self.width, self.height = size
+        self.color = color
+        self.min_height = min_height
+        self.max_height = int(self.height * max_height)
+        self.max_cap_height = int(self.height * max_height * 0.1)
+
+        self.bar_width = max(1, self.width // bars)
+        self.sprite_width = max(1, self.bar_width - 2)
+        self.xs = [i * self.bar_width for i in range(bars)]
+        if reverse:
+            # Зеркальная группа: низкие частоты справа
+            self.xs.reverse()
+        self.radius = min(border_radius, self.sprite_width // 2, max(self.max_height, 1) // 2)
+        self.border_radius = border_radius
+
+        if color is None:
+            palette = [tuple(int(c) for c in rgb) for rgb in rainbow_palette(bars)]
+            self.bar_colors = palette
+            self.cap_colors = palette  # Яркость крышек ограничена 1.0, как у баров
+        else:
+            self.bar_colors = [color] * bars
+            self.cap_colors = [CAP_COLOR] * bars
+
+        # Спрайт бара максимальной высоты на фон экрана; для скруглённых баров
+        # кадр собирается из верхней части спрайта и его нижних углов
+        sprites = {}
+        self.sprites = []
+        for bar_color in self.bar_colors:
+            if bar_color not in sprites:
+                sprite = pygame.Surface((self.sprite_width, max(self.max_height, 1)))
+                sprite.fill(BACKGROUND)
+                pygame.draw.rect(sprite, bar_color, sprite.get_rect(), border_radius=self.radius)
+                sprites[bar_color] = sprite
+            self.sprites.append(sprites[bar_color])
+        self._cap_cache = {}
+
+        self.heights = np.zeros(bars, dtype=int)
+        self.caps = np.zeros(bars, dtype=int)
+        self._tops = np.zeros(bars, dtype=int)
+        self._has_cap = np.zeros(bars, dtype=bool)
+        self._prev_tops = np.full(bars, self.height, dtype=int)
+        self._prev_heights = np.full(bars, -1, dtype=int)
+        self._prev_caps = np.full(bars, -1, dtype=int)
+        self._full_redraw = True
+
+    def matches(self, bars, size, color, border_radius, min_height, max_height):
+        return self.key == (bars, tuple(size), color, border_radius, min_height, max_height)
+
+    def invalidate(self):
+        self._full_redraw = True
+
+    def _cap_sprite(self, color, height):
+        key = (color, height)
+        sprite = self._cap_cache.get(key)
+        if sprite is None:
+            sprite = pygame.Surface((self.sprite_width, height))
+            sprite.fill(BACKGROUND)
+            pygame.draw.rect(sprite, color, sprite.get_rect(), border_radius=self.border_radius)
+            self._cap_cache[key] = sprite
+        return sprite
+
+    def draw(self, screen, magnitudes, cap_heights=None, scale=1.0, present=True):
+        bars = self.bars
+        np.multiply(magnitudes[:bars], 50 / scale, out=self._tops, casting='unsafe')
+        np.add(self._tops, self.min_height, out=self.heights)
+        np.minimum(self.heights, self.max_height, out=self.heights)
+        if cap_heights is not None:
+            np.minimum(cap_heights[:bars], self.max_cap_height, out=self.caps, casting='unsafe')
+            np.maximum(self.caps, 0, out=self.caps)
+        else:
+            self.caps.fill(0)
+        # Верх столбца: бар, а над ним зазор и крышка
+        np.subtract(self.height, self.heights, out=self._tops)
+        np.greater(self.caps, 0, out=self._has_cap)
+        np.subtract(self._tops, self.caps, out=self._tops)
+        np.subtract(self._tops, self._has_cap * CAP_GAP, out=self._tops, casting='unsafe')
+
+        if self._full_redraw:
+            screen.fill(BACKGROUND)
+            changed = range(bars)
+        else:
+            changed = np.flatnonzero((self.heights != self._prev_heights) | (self.caps != self._prev_caps)).tolist()
+
+        blits = []
+        dirty = []
+        radius = self.radius
+        bottom = self.height
+        for i in changed:
+            x = self.xs[i]
+            h = int(self.heights[i])
+            top = int(self._tops[i])
+            column_top = min(top, int(self._prev_tops[i]))
+            # Очистка области над новым баром (старый бар, крышка и зазор)
+            if not self._full_redraw and column_top < bottom - h:
+                screen.fill(BACKGROUND, (x, column_top, self.sprite_width, bottom - h - column_top))
+            sprite = self.sprites[i]
+            if radius == 0:
+                blits.append((sprite, (x, bottom - h), (0, 0, self.sprite_width, h)))
+            elif h >= 2 * radius:
+                blits.append((sprite, (x, bottom - h), (0, 0, self.sprite_width, h - radius)))
+                blits.append((sprite, (x, bottom - radius), (0, self.max_height - radius, self.sprite_width, radius)))
+            else:
+                # Низкий скруглённый бар: радиус меньше, чем у спрайта, рисуем напрямую
+                rect = (x, bottom - h, self.sprite_width, h)
+                screen.fill(BACKGROUND, rect)
+                pygame.draw.rect(screen, self.bar_colors[i], rect, border_radius=self.border_radius)
+            cap = int(self.caps[i])
+            if cap > 0:
+                blits.append((self._cap_sprite(self.cap_colors[i], cap), (x, bottom - h - cap - CAP_GAP)))
+            dirty.append(pygame.Rect(x, column_top, self.sprite_width, bottom - column_top))
+        if blits:
+            screen.blits(blits, doreturn=False)
+
+        self._prev_heights[:] = self.heights
+        self._prev_caps[:] = self.caps
+        self._prev_tops[:] = self._tops
+        if self._full_redraw:
+            self._full_redraw = False
+            dirty = None  # Нужен полный flip
+        if present:
+            self.present(dirty)
+        return dirty
+
+    @staticmethod
+    def present(dirty):
+        # None — обновить весь экран, иначе только изменившиеся прямоугольники
+        if dirty is None:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
+
+
+LAYOUTS = ("mirrored", "stacked")
+
+
+class GroupRenderer:
+    # Несколько источников (каналы, устройства): по группе баров на источник.
+    # mirrored — группы рядом, чётные зеркально (у стерео низкие частоты сходятся в центре);
+    # stacked — группы друг над другом. Каждая группа рисуется в свою подповерхность экрана.
+    def __init__(self, screen, sources, bars, color, border_radius=0, min_height=10, max_height=0.8,
+                 layout="mirrored"):
+        self.screen = screen
+        self.key = (screen.get_size(), sources, bars, color, border_radius, min_height, max_height, layout)
+        width, height = screen.get_size()
+        self.groups = []
+        for i in range(sources):
+            if layout == "stacked":
+                rect = pygame.Rect(0, i * height // sources, width, height // sources)
+                reverse = False
+            else:
+                rect = pygame.Rect(i * width // sources, 0, width // sources, height)
+                reverse = i % 2 == 0 and sources > 1
+            renderer = BarRenderer(bars, rect.size, color, border_radius, min_height, max_height, reverse)
+            self.groups.append((screen.subsurface(rect), rect.topleft, renderer))
+
+    def matches(self, screen, sources, bars, color, border_radius, min_height, max_height, layout):
+        return self.screen is screen and self.key == (screen.get_size(), sources, bars, color, border_radius,
+                                                      min_height, max_height, layout)
+
+    def invalidate(self):
+        for _, _, renderer in self.groups:
+            renderer.invalidate()
+
+    def draw(self, screen, magnitudes, cap_heights=None, scale=1.0, present=True):
+        dirty = []
+        for i, (surface, (left, top), renderer) in enumerate(self.groups):
+            caps = cap_heights[i] if cap_heights is not None else None
+            group_dirty = renderer.draw(surface, magnitudes[i], caps, scale, present=False)
+            if group_dirty is None:
+                dirty = None
+            elif dirty is not None:
+                dirty.extend(rect.move(left, top) for rect in group_dirty)
+        if present:
+            self.present(dirty)
+        return dirty
+
+    present = staticmethod(BarRenderer.present)
+
+
+VISUAL_MODES = ("bars", "spectrogram", "waterfall")
+LUT_SIZE = 256  # Уровней интенсивности в таблице цветов
+
+
+def colormap(color, size=LUT_SIZE):
+    # Таблица цветов по интенсивности 0..1: от фона к цвету баров, для радужных — от синего к красному
+    level = np.linspace(0.0, 1.0, size)[:, None]
+    if color is None:
+        hues = rainbow_palette(size * 3 // 2)[:size][::-1]  # Оттенки от синего (2/3) до красного (0)
+    else:
+        hues = np.array(color)[None, :]
+    return (hues * level).astype(np.uint8)
+
+
+class SpectrogramRenderer:
+    # Спектрограмма (время по горизонтали, новые столбцы справа) или водопад (время по вертикали,
+    # новые строки сверху). Историей служит сам экран: каждый кадр он сдвигается Surface.scroll
+    # и дописывается один столбец, цвета которого берутся из таблицы, построенной один раз.
+    # Отдельной поверхности истории нет, поэтому нет и копирования её на экран; работа на кадр —
+    # один сдвиг памяти экрана и столбец. Несколько источников делят ось частот поровну.
+    def __init__(self, screen, sources, bars, color, max_height=0.8, mode="spectrogram", step=1):
+        self.screen = screen
+        self.key = (screen.get_size(), sources, bars, color, max_height, mode)
+        self.mode = mode
+        self.step = step
+        width, height = screen.get_size()
+        self.lut = np.array([screen.map_rgb(tuple(rgb)) for rgb in colormap(color)], dtype=np.uint32)
+
+        # Для каждого пикселя оси частот — индекс (источник, бар) в развёрнутом массиве амплитуд
+        length = height if mode == "spectrogram" else width
+        band = max(1, length // sources)
+        position = np.arange(length)
+        source = np.minimum(position // band, sources - 1)
+        bar = np.minimum((position - source * band) * bars // band, bars - 1)
+        index = source * bars + bar
+        if mode == "spectrogram":
+            index = index[::-1]  # Низкие частоты внизу
+        self._index = np.ascontiguousarray(index)
+        # Амплитуда, при которой бар достиг бы максимальной высоты, соответствует концу таблицы
+        self._norm = (LUT_SIZE - 1) * 50 / max(1, int(height * max_height))
+        self._levels = np.zeros(length)
+        self._bins = np.zeros(length, dtype=np.intp)
+        self._column = np.zeros(length, dtype=np.uint32)
+        self._cleared = False
+
+    def matches(self, screen, sources, bars, color, max_height, mode):
+        return self.screen is screen and self.key == (screen.get_size(), sources, bars, color, max_height, mode)
+
+    def invalidate(self):
+        # История остаётся на экране; каждый кадр и так выводится целиком
+        pass
+
+    def draw(self, screen, magnitudes, cap_heights=None, scale=1.0, present=True):
+        # Крышки в этом режиме не рисуются
+        if not self._cleared:
+            screen.fill(BACKGROUND)
+            self._cleared = True
+        np.take(magnitudes.reshape(-1), self._index, out=self._levels)
+        self._levels *= self._norm / scale
+        np.clip(self._levels, 0, LUT_SIZE - 1, out=self._levels)
+        np.copyto(self._bins, self._levels, casting='unsafe')
+        np.take(self.lut, self._bins, out=self._column)
+
+        step = self.step
+        if self.mode == "spectrogram":
+            screen.scroll(-step, 0)
+            pixels = pygame.surfarray.pixels2d(screen)
+            pixels[-step:, :] = self._column
+        else:
+            screen.scroll(0, step)
+            pixels = pygame.surfarray.pixels2d(screen)
+            pixels[:, :step] = self._column[:, None]
+        del pixels  # Снимает блокировку поверхности
+        if present:
+            self.present(None)
+        return None
+
+    present = staticmethod(BarRenderer.present)
+
+
+class BeatFlash:
+    # Вспышка на долю: полоса вдоль верхнего края окна (над барами), яркость которой спадает
+    # за decay секунд. Перерисовывается одним fill только при смене яркости
+    def __init__(self, decay=0.15, thickness=0.015):
+        self.decay = decay
+        self.thickness = thickness
+        self.peak = 0.0
+        self.triggered = 0.0
+        self.shown = 0.0  # Яркость полосы на экране
+
+    def trigger(self, strength):
+        # strength — превышение порога долей в средних отклонениях
+        self.peak = min(1.0, 0.5 + strength / 10)
+        self.triggered = time.perf_counter()
+
+    @property
+    def active(self):
+        return self.peak > 0.0 or self.shown > 0.0
+
+    def draw(self, screen, color, force=False):
+        # Прямоугольник полосы или None, если на экране ничего не изменилось
+        level = 0.0
+        if self.peak:
+            level = self.peak * math.exp(-(time.perf_counter() - self.triggered) / self.decay)
+            if level < 0.02:
+                level = self.peak = 0.0
+        level = round(level, 2)
+        if level == self.shown and not force:
+            return None
+        self.shown = level
+        rect = pygame.Rect(0, 0, screen.get_width(), max(2, int(screen.get_height() * self.thickness)))
+        screen.fill(tuple(int(c * level) for c in (color or CAP_COLOR)), rect)
+        return rect
@@ -0,0 +1,189 @@
+import time
+
+import numpy as np
+import pygame
+
+
+class FrameScheduler:
+    # Планировщик кадров с целевым FPS. Ожидание делает pygame.time.Clock.tick
+    # (SDL_Delay, без загрузки ядра), tick_busy_loop точнее, но крутит процессор.
+    # Если анализ и отрисовка не укладываются в бюджет кадра, следующие кадры
+    # пропускаются, чтобы догнать звук.
+    def __init__(self, target_fps=60, busy_loop=False, history=512):
+        self.target_fps = target_fps
+        self.busy_loop = busy_loop
+        self.clock = pygame.time.Clock()
+        self.frame_times = np.zeros(history)  # Длительности кадров, с (кольцевая история)
+        self.frames = 0
+        self.dropped = 0  # Пропущенные кадры
+        self.skip = 0  # Сколько следующих кадров не отрисовывать
+        self.work_time = 0.0  # Время анализа и отрисовки последнего кадра
+        self.wait_time = 0.0  # Время ожидания следующего кадра
+        self._frame_start = time.perf_counter()
+        self._last_tick = self._frame_start
+
+    @property
+    def budget(self):
+        return 1.0 / self.target_fps if self.target_fps else 0.0
+
+    def begin_frame(self):
+        self._frame_start = time.perf_counter()
+
+    def should_draw(self):
+        if self.skip > 0:
+            self.skip -= 1
+            self.dropped += 1
+            return False
+        return True
+
+    def end_frame(self):
+        now = time.perf_counter()
+        self.work_time = now - self._frame_start
+        budget = self.budget
+        if budget and self.work_time > budget:
+            # Перерасход бюджета: пропускаем столько кадров, сколько заняла работа сверх бюджета
+            self.skip = min(int(self.work_time / budget), self.target_fps)
+        if self.busy_loop:
+            self.clock.tick_busy_loop(self.target_fps)
+        else:
+            self.clock.tick(self.target_fps)
+        waited = time.perf_counter()
+        self.wait_time = waited - now
+        now = waited
+        self.frame_times[self.frames % len(self.frame_times)] = now - self._last_tick
+        self._last_tick = now
+        self.frames += 1
+
+    def percentiles(self, q=(50, 95, 99)):
+        count = min(self.frames, len(self.frame_times))
+        if not count:
+            return {p: 0.0 for p in q}
+        values = np.percentile(self.frame_times[:count], q)
+        return {p: float(v) for p, v in zip(q, values)}
+
+    def stats(self):
+        p = self.percentiles()
+        return {
+            'fps': self.clock.get_fps(),
+            'frame_ms_p50': p[50] * 1000,
+            'frame_ms_p95': p[95] * 1000,
+            'frame_ms_p99': p[99] * 1000,
+            'dropped': self.dropped,
+            'frames': self.frames,
+        }
+
+
+class SpectrumInterpolator:
+    # Плавный переход между спектрами соседних шагов анализа:
+    # при FPS выше частоты шагов бары интерполируются, а не стоят на месте
+    def __init__(self, size, hop_duration):
+        self.hop_duration = hop_duration
+        self.previous = np.zeros(size)
+        self.current = np.zeros(size)
+        self.shown = np.zeros(size)
+        self.arrived = time.perf_counter()
+        self.settled = True  # Интерполяция завершена, повторная отрисовка не нужна
+
+    def push(self, bars):
+        np.copyto(self.previous, self.shown)
+        np.copyto(self.current, bars)
+        self.arrived = time.perf_counter()
+        self.settled = False
+
+    def value(self):
+        alpha = (time.perf_counter() - self.arrived) / self.hop_duration if self.hop_duration else 1.0
+        if alpha >= 1.0:
+            np.copyto(self.shown, self.current)
+            self.settled = True
+        else:
+            np.subtract(self.current, self.previous, out=self.shown)
+            self.shown *= alpha
+            self.shown += self.previous
+        return self.shown
+
+
+# Ступени понижения качества по порядку (каждая добавляется к предыдущим): описание при понижении
+# и при возврате
+QUALITY_STEPS = (
+    ("скругление выключено", "скругление включено"),
+    ("крышки выключены", "крышки включены"),
+    ("бары x0.75", "все бары"),
+    ("бары x0.5", "бары x0.75"),
+)
+MIN_BARS = 10  # Нижний предел GUI
+
+
+class QualityGovernor:
+    # Регулятор качества отрисовки. Нагрузка кадра — доля бюджета: работа кадра отрисовки
+    # к 1 / target_fps. Время анализа не учитывается: ступени меняют только работу отрисовки,
+    # а отставший анализ и так перескакивает к последним данным. Раз в окно берётся p95
+    # нагрузки: выше high — качество понижается на ступень, ниже low в течение calm секунд —
+    # повышается. После каждой смены новая не раньше чем через cooldown (гистерезис).
+    def __init__(self, window=1.0, high=0.9, low=0.5, cooldown=2.0, calm=5.0, history=512):
+        self.window = window
+        self.high, self.low = high, low
+        self.cooldown, self.calm = cooldown, calm
+        self.level = 0
+        self.loads = np.zeros(history)  # Нагрузки кадров текущего окна
+        self.count = 0
+        self.calm_time = 0.0  # Сколько подряд нагрузка ниже low
+        self._window_start = time.perf_counter()
+        self._changed = self._window_start - cooldown
+        self._matrices = {}  # (бары на входе, бары на выходе) -> матрица усреднения
+
+    def observe(self, work_time, budget):
+        if budget and self.count < len(self.loads):
+            self.loads[self.count] = work_time / budget
+            self.count += 1
+
+    def update(self):
+        # Раз в окно: новая ступень или None. Сообщение — для консоли GUI
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return None
+        load = float(np.percentile(self.loads[:self.count], 95)) if self.count else 0.0
+        self.count = 0
+        self._window_start = now
+        message = None
+        if load > self.high:
+            self.calm_time = 0.0
+            if self.level < len(QUALITY_STEPS) and now - self._changed >= self.cooldown:
+                self.level += 1
+                message = f"Качество понижено: {QUALITY_STEPS[self.level - 1][0]} (нагрузка {load:.0%})"
+        elif load < self.low:
+            self.calm_time += elapsed
+            if self.level and self.calm_time >= self.calm and now - self._changed >= self.cooldown:
+                self.level -= 1
+                self.calm_time = 0.0
+                message = f"Качество повышено: {QUALITY_STEPS[self.level][1]} (нагрузка {load:.0%})"
+        else:
+            self.calm_time = 0.0
+        if message:
+            self._changed = now
+        return message
+
+    def effective(self, border_radius, use_caps, bars):
+        # Параметры отрисовки на текущей ступени: (скругление, крышки, бары)
+        if self.level >= 1:
+            border_radius = 0
+        if self.level >= 2:
+            use_caps = False
+        if self.level >= 3:
+            factor = 0.75 if self.level == 3 else 0.5
+            bars = max(min(bars, MIN_BARS), int(bars * factor))
+        return border_radius, use_caps, bars
+
+    def reduce(self, values, bars):
+        # Усреднение соседних баров до bars (последняя ось); матрица строится один раз на пару размеров
+        size = values.shape[-1]
+        if bars >= size:
+            return values
+        matrix = self._matrices.get((size, bars))
+        if matrix is None:
+            edges = np.linspace(0, size, bars + 1).astype(int)
+            matrix = np.zeros((size, bars))
+            for i in range(bars):
+                matrix[edges[i]:edges[i + 1], i] = 1.0 / (edges[i + 1] - edges[i])
+            self._matrices[(size, bars)] = matrix
+        return values @ matrix
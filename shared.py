@@ -0,0 +1,91 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Показатели анализа, передаваемые вместе со спектром (последние значения, секунды или штуки):
+# время стадий, задержка и очередь, а также уровень для автоматической чувствительности,
+# счётчик и сила долей, темп (BPM) и уверенность в нём
+STATS = ("fft", "binning", "decay", "latency", "queue_depth", "dropped_samples", "xruns", "onset", "level",
+         "onsets", "onset_strength", "tempo", "tempo_confidence")
+
+
+class SharedSpectrum:
+    # Спектр в разделяемой памяти: два слота и номер последней публикации, без сериализации.
+    # Писатель заполняет слот seq % 2 и ставит номер в слот после записи; читатель копирует
+    # слот и сверяет номер до и после копирования (seqlock), поэтому ни одна сторона не ждёт другую.
+    # Размер задаётся ёмкостью (источники x бары), фактическая форма хранится в каждом слоте.
+    def __init__(self, sources, bars, name=None):
+        self.sources, self.bars = sources, bars
+        slot_size = 8 * (3 + len(STATS) + 2 * sources * bars)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=16 + 2 * slot_size)
+        self.name = self.shm.name
+        buf = self.shm.buf
+        self.header = np.ndarray((2,), np.int64, buf, 0)  # Номер последней публикации, резерв
+        self.meta, self.stats, self.magnitudes, self.cap_heights = [], [], [], []
+        for i in range(2):
+            offset = 16 + i * slot_size
+            self.meta.append(np.ndarray((3,), np.int64, buf, offset))  # Номер, источники, бары
+            offset += 8 * 3
+            self.stats.append(np.ndarray((len(STATS),), np.float64, buf, offset))
+            offset += 8 * len(STATS)
+            self.magnitudes.append(np.ndarray((sources, bars), np.float64, buf, offset))
+            offset += 8 * sources * bars
+            self.cap_heights.append(np.ndarray((sources, bars), np.float64, buf, offset))
+        if self.owner:
+            self.header.fill(0)
+            for meta in self.meta:
+                meta.fill(0)
+        self.seen = 0  # Последний прочитанный номер (на стороне читателя)
+        # Буферы читателя, в которые копируется слот
+        self._magnitudes = np.zeros((sources, bars))
+        self._cap_heights = np.zeros((sources, bars))
+        self._stats = np.zeros(len(STATS))
+
+    def publish(self, magnitudes, cap_heights, stats=()):
+        # magnitudes и cap_heights — (бары,) или (источники, бары)
+        shape = (1,) + magnitudes.shape if magnitudes.ndim == 1 else magnitudes.shape
+        sources, bars = shape
+        if sources > self.sources or bars > self.bars:
+            raise ValueError(f"Спектр {shape} не помещается в разделяемый буфер {(self.sources, self.bars)}")
+        seq = int(self.header[0]) + 1
+        slot = seq % 2
+        meta = self.meta[slot]
+        meta[0] = -1  # Слот переписывается
+        np.copyto(self.magnitudes[slot][:sources, :bars], magnitudes.reshape(shape))
+        np.copyto(self.cap_heights[slot][:sources, :bars], cap_heights.reshape(shape))
+        self.stats[slot][:len(stats)] = stats
+        meta[1], meta[2] = sources, bars
+        meta[0] = seq
+        self.header[0] = seq
+        return seq
+
+    def read(self):
+        # Новый спектр: (magnitudes, cap_heights, stats) — представления буферов читателя,
+        # действительные до следующего read; None, если публикаций не было или слот переписывается
+        seq = int(self.header[0])
+        if seq == self.seen:
+            return None
+        slot = seq % 2
+        meta = self.meta[slot]
+        if meta[0] != seq:
+            return None
+        sources, bars = int(meta[1]), int(meta[2])
+        magnitudes = self._magnitudes[:sources, :bars]
+        cap_heights = self._cap_heights[:sources, :bars]
+        np.copyto(magnitudes, self.magnitudes[slot][:sources, :bars])
+        np.copyto(cap_heights, self.cap_heights[slot][:sources, :bars])
+        np.copyto(self._stats, self.stats[slot])
+        if meta[0] != seq:
+            return None
+        self.seen = seq
+        if sources == 1:
+            magnitudes, cap_heights = magnitudes[0], cap_heights[0]
+        return magnitudes, cap_heights, self._stats
+
+    def close(self):
+        # Представления держат экспорт буфера, их нужно освободить до закрытия памяти
+        self.header = self.meta = self.stats = self.magnitudes = self.cap_heights = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,204 @@
+from functools import lru_cache
+
+import numpy as np
+
+SCALES = ("linear", "log", "mel", "octave")
+
+# Размер FFT относительно CHUNK: нелинейным шкалам нужно лучшее разрешение на низких частотах
+FFT_FACTORS = {"linear": 1, "log": 4, "mel": 4, "octave": 4}
+
+SUPPRESSED_BARS = 3  # Количество подавляемых низкочастотных баров (только линейная шкала)
+SUPPRESS_FACTOR = 0.5  # Коэффициент подавления
+
+
+def frequency_range(scale, rate, f_min=None, f_max=None):
+    # Линейная шкала по умолчанию покрывает нижнюю четверть спектра, как раньше
+    if scale == "linear":
+        default_min, default_max = 0.0, rate / 4
+    else:
+        default_min, default_max = 30.0, min(16000.0, rate / 2)
+    f_min = default_min if f_min is None else float(f_min)
+    f_max = default_max if f_max is None else float(min(f_max, rate / 2))
+    return f_min, f_max
+
+
+def hz_to_mel(f):
+    return 2595.0 * np.log10(1.0 + np.asarray(f) / 700.0)
+
+
+def mel_to_hz(m):
+    return 700.0 * (10.0 ** (np.asarray(m) / 2595.0) - 1.0)
+
+
+def _triangular(freqs, edges):
+    # Треугольные фильтры с вершинами в edges[1:-1]
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (freqs - lower) / np.maximum(center - lower, 1e-9)
+    falling = (upper - freqs) / np.maximum(upper - center, 1e-9)
+    return np.maximum(0.0, np.minimum(rising, falling))
+
+
+def _octave_bands(bars, f_min, f_max):
+    # Номинальные центры 1/3 октавы (база 2, опорная 1 кГц) в диапазоне;
+    # если баров больше, чем полос, соседние бары делят одну полосу
+    k = np.arange(np.ceil(3 * np.log2(f_min / 1000.0)), np.floor(3 * np.log2(f_max / 1000.0)) + 1)
+    centers = 1000.0 * 2.0 ** (k / 3)
+    if len(centers) == 0:
+        centers = np.array([np.sqrt(f_min * f_max)])
+    index = np.minimum((np.arange(bars) * len(centers)) // bars, len(centers) - 1)
+    return centers[index]
+
+
+@lru_cache(maxsize=16)
+def filterbank(rate, fft_size, bars, scale, f_min, f_max):
+    # Матрица весов (бары x бины) для диапазона бинов [first, last).
+    # Строится один раз на набор параметров; применение — одно умножение матрицы на вектор.
+    resolution = rate / fft_size
+    first = max(0, int(round(f_min / resolution)))
+    last = min(fft_size // 2 + 1, max(first + 1, int(round(f_max / resolution))))
+    freqs = np.arange(first, last) * resolution
+
+    if scale == "linear":
+        # Равные полосы по бинам, среднее по полосе; лишние бины справа отбрасываются
+        width = max(1, len(freqs) // bars)
+        weights = np.zeros((bars, len(freqs)))
+        for i in range(bars):
+            weights[i, i * width:(i + 1) * width] = 1.0 / width
+        weights[:SUPPRESSED_BARS] *= SUPPRESS_FACTOR
+    else:
+        low = max(f_min, resolution)
+        if scale == "log":
+            edges = np.geomspace(low, f_max, bars + 2)
+            centers = edges[1:-1]
+            weights = _triangular(freqs, edges)
+        elif scale == "mel":
+            edges = mel_to_hz(np.linspace(hz_to_mel(low), hz_to_mel(f_max), bars + 2))
+            centers = edges[1:-1]
+            weights = _triangular(freqs, edges)
+        elif scale == "octave":
+            centers = _octave_bands(bars, low, f_max)
+            lower, upper = centers * 2.0 ** (-1 / 6), centers * 2.0 ** (1 / 6)
+            weights = ((freqs >= lower[:, None]) & (freqs < upper[:, None])).astype(float)
+        else:
+            raise ValueError(f"Неизвестная шкала частот: {scale}")
+        # Полосы уже шага FFT (низкие частоты): берётся ближайший бин
+        empty = np.flatnonzero(weights.sum(axis=1) == 0)
+        if len(empty):
+            nearest = np.clip(np.round(centers[empty] / resolution).astype(int) - first, 0, len(freqs) - 1)
+            weights[empty, nearest] = 1.0
+        # Значение бара — средняя амплитуда в полосе
+        weights /= weights.sum(axis=1, keepdims=True)
+
+    weights.setflags(write=False)
+    return weights, first, last
+
+
+@lru_cache(maxsize=16)
+def analysis_window(chunk, fft_size, gain):
+    # Окно с усилением входа. Для линейной шкалы прямоугольное, как раньше;
+    # для длинных FFT — окно Ханна, приведённое к уровню прямоугольного окна CHUNK
+    if fft_size == chunk:
+        window = np.full(fft_size, gain, dtype=np.float64)
+    else:
+        window = np.hanning(fft_size) * (2.0 * gain * chunk / fft_size)
+    window.setflags(write=False)
+    return window
+
+
+class SpectrumAnalyzer:
+    # План анализа строится один раз для набора (CHUNK, RATE, бары, шкала, диапазон):
+    # окно с учётом усиления и матрица фильтров берутся из кэша.
+    # Все буферы выделяются заранее и обновляются на месте.
+    # При channels > 1 все источники анализируются одним двумерным FFT, состояние — (каналы x бары).
+    CAP_HEIGHT = 10  # Фиксированная высота крышки при росте бара
+
+    def __init__(self, chunk, rate, bars, gain=1.0, fft_gain=1.0, scale="linear", f_min=None, f_max=None,
+                 channels=1):
+        f_min, f_max = frequency_range(scale, rate, f_min, f_max)
+        self.key = (chunk, rate, bars, scale, f_min, f_max, channels)
+        self.channels = channels
+        self.chunk = chunk
+        self.rate = rate
+        self.bars = bars
+        self.scale = scale
+        self.f_min, self.f_max = f_min, f_max
+        self.gain = gain
+        self.fft_gain = fft_gain
+
+        self.fft_size = chunk * FFT_FACTORS[scale]
+        self.window = analysis_window(chunk, self.fft_size, gain)
+        self.weights, self.first_bin, self.last_bin = filterbank(rate, self.fft_size, bars, scale, f_min, f_max)
+
+        # Предвыделенные буферы
+        lead = () if channels == 1 else (channels,)
+        self._frame = np.zeros(lead + (self.fft_size,), dtype=np.float64)
+        # Окно в форме кадра: поэлементные операции с растяжением по каналам и со срезами
+        # двумерных массивов numpy выполняет через временный буфер
+        self._window = np.tile(self.window, lead + (1,))
+        self._spectrum = np.zeros(lead + (self.fft_size // 2 + 1,), dtype=np.complex128)
+        self._amplitude = np.zeros(self._spectrum.shape, dtype=np.float64)
+        self._magnitude = np.zeros(lead + (self.last_bin - self.first_bin,), dtype=np.float64)
+        self._weights_t = self.weights.T
+        self.raw = np.zeros(lead + (bars,), dtype=np.float64)
+        self.magnitudes = np.zeros(lead + (bars,), dtype=np.float64)
+        self.cap_heights = np.zeros(lead + (bars,), dtype=np.float64)
+        self._floor = np.zeros(lead + (bars,), dtype=np.float64)
+        self._rising = np.zeros(lead + (bars,), dtype=bool)
+
+    def matches(self, chunk, rate, bars, scale="linear", f_min=None, f_max=None, channels=1):
+        return self.key == (chunk, rate, bars, scale) + frequency_range(scale, rate, f_min, f_max) + (channels,)
+
+    def reset(self):
+        self.magnitudes.fill(0)
+        self.cap_heights.fill(0)
+
+    def bin(self, data, out=None):
+        # Сырые амплитуды баров без состояния (FFT + фильтры)
+        self.transform(data)
+        return self.reduce(out)
+
+    def transform(self, data):
+        # Окно, FFT и логарифм амплитуд в предвыделенный буфер; data — (n,) или (каналы, n)
+        n = min(data.shape[-1], self.fft_size)
+        # Копирование с приведением float32 -> float64 без временного буфера, затем окно на месте
+        np.copyto(self._frame[..., -n:], data[..., -n:])
+        if n < self.fft_size:
+            self._frame[..., :-n] = 0
+        self._frame *= self._window
+        np.fft.rfft(self._frame, axis=-1, out=self._spectrum)
+        np.abs(self._spectrum, out=self._amplitude)
+        np.copyto(self._magnitude, self._amplitude[..., self.first_bin:self.last_bin])
+        self._magnitude *= self.fft_gain
+        np.log1p(self._magnitude, out=self._magnitude)  # Мягкое логарифмическое масштабирование
+        return self._magnitude
+
+    def reduce(self, out=None):
+        # Группировка бинов по барам одним умножением матрицы на вектор (на матрицу для каналов)
+        out = self.raw if out is None else out
+        np.matmul(self._magnitude, self._weights_t, out=out)
+        return out
+
+    def bin_batch(self, frames, out):
+        # То же, что bin, для пачки окон (frames x fft_size) одним двумерным FFT
+        spectrum = np.fft.rfft(frames * self.window, axis=1)
+        magnitude = np.abs(spectrum[:, self.first_bin:self.last_bin])
+        magnitude *= self.fft_gain
+        np.log1p(magnitude, out=magnitude)
+        out[:] = magnitude @ self._weights_t
+        return out
+
+    def decay(self, raw, decay_factor, use_caps=False, cap_decay_factor=0.0):
+        # Угасание баров: новое значение не опускается ниже затухшего предыдущего
+        np.multiply(self.magnitudes, 1 - decay_factor, out=self._floor)
+        if use_caps:
+            # Крышка подскакивает, если бар растёт быстрее угасания, иначе угасает
+            np.greater(raw, self._floor, out=self._rising)
+            self.cap_heights *= 1 - cap_decay_factor
+            np.copyto(self.cap_heights, self.CAP_HEIGHT, where=self._rising)
+        else:
+            self.cap_heights.fill(0)
+        np.maximum(raw, self._floor, out=self.magnitudes)
+        return self.magnitudes
+
+    def process(self, data, decay_factor, use_caps=False, cap_decay_factor=0.0):
+        return self.decay(self.bin(data), decay_factor, use_caps, cap_decay_factor)
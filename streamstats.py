@@ -0,0 +1,148 @@
+import math
+
+import numpy as np
+
+
+class BandStats:
+    # Скользящие показатели по полосам за постоянную память, векторно по всем полосам (и источникам):
+    # RMS — экспоненциальное среднее квадратов за window секунд; пик держится hold секунд и затем
+    # спадает за release; перцентили — стохастическое приближение: оценка на каждом шаге сдвигается
+    # вверх на q * step, если значение выше неё, и вниз на (1 - q) * step, если ниже, шаг пропорционален RMS
+    def __init__(self, shape, step_rate, quantiles=(0.5, 0.95), window=2.0, hold=1.0, release=1.0):
+        self.shape = tuple(shape)
+        self.step_rate = step_rate
+        steps = max(window * step_rate, 1.0)
+        self.alpha = 1.0 - math.exp(-1.0 / steps)
+        self.hold_steps = int(hold * step_rate)
+        self.release = math.exp(-1.0 / max(release * step_rate, 1.0))
+        self.quantiles = np.array(quantiles, dtype=np.float64).reshape((-1,) + (1,) * len(self.shape))
+        self.mean_square = np.zeros(self.shape)
+        self.rms = np.zeros(self.shape)
+        self.peak = np.zeros(self.shape)
+        self.estimates = np.zeros((len(quantiles),) + self.shape)  # Оценки перцентилей, по строке на q
+        self.held = np.zeros(self.shape, dtype=np.int64)  # Шагов с момента последнего пика
+        self._square = np.zeros(self.shape)
+        self._rising = np.zeros(self.shape, dtype=bool)
+        self._expired = np.zeros(self.shape, dtype=bool)
+        self._step = np.zeros(self.shape)
+        self._below = np.zeros(self.estimates.shape)
+        self._shift = np.zeros(self.estimates.shape)
+
+    def matches(self, shape, step_rate):
+        return self.shape == tuple(shape) and self.step_rate == step_rate
+
+    def update(self, values):
+        np.multiply(values, values, out=self._square)
+        self._square -= self.mean_square
+        self._square *= self.alpha
+        self.mean_square += self._square
+        np.sqrt(self.mean_square, out=self.rms)
+
+        # Пик с удержанием: новый максимум обнуляет счётчик, после удержания пик спадает
+        np.greater_equal(values, self.peak, out=self._rising)
+        self.held += 1
+        np.copyto(self.held, 0, where=self._rising)
+        np.greater(self.held, self.hold_steps, out=self._expired)
+        np.multiply(self.peak, self.release, out=self.peak, where=self._expired)
+        np.maximum(self.peak, values, out=self.peak)
+
+        # Перцентили: сдвиг (q - [x < оценки]) * шаг; шаг порядка alpha * RMS, чтобы оценка
+        # следовала за громкостью примерно с той же скоростью, что и RMS
+        np.multiply(self.rms, 2.0 * self.alpha, out=self._step)
+        np.less(values, self.estimates, out=self._below, casting='unsafe')
+        np.subtract(self.quantiles, self._below, out=self._shift)
+        self._shift *= self._step
+        self.estimates += self._shift
+
+    def percentile(self, q):
+        # Оценка по полосам для одного из отслеживаемых q
+        index = int(np.flatnonzero(np.isclose(self.quantiles.ravel(), q))[0])
+        return self.estimates[index]
+
+
+class OnsetDetector:
+    # Доли и темп по уже посчитанному спектру баров (логарифмические амплитуды), без своих FFT.
+    # Спектральный поток — сумма положительных приращений по всем полосам за шаг. Доля — поток выше
+    # среднего на sensitivity средних отклонений (экспоненциальные средние за window секунд) и не
+    # раньше refractory после предыдущей. Темп — максимум автокорреляции превышений потока по лагам
+    # диапазона bpm; автокорреляция обновляется на каждом шаге за O(лагов) и забывается за memory
+    # секунд, выбор лага взвешен логнормальным предпочтением около prefer BPM (против кратных темпов).
+    def __init__(self, shape, step_rate, sensitivity=2.0, window=1.0, refractory=0.1, bpm=(60, 200),
+                 prefer=120, memory=8.0):
+        self.shape = tuple(shape)
+        self.step_rate = step_rate
+        self.sensitivity = sensitivity
+        self.alpha = 1.0 - math.exp(-1.0 / max(window * step_rate, 1.0))
+        self.refractory = max(1, int(refractory * step_rate))
+        self.previous = np.zeros(self.shape)
+        self._delta = np.zeros(self.shape)
+        self.flux = 0.0
+        self.mean = 0.0
+        self.deviation = 0.0
+        self.strength = 0.0  # Превышение порога последней доли, в отклонениях
+        self.onsets = 0  # Счётчик долей: по его приросту читатель узнаёт о новых долях
+        self.since = self.refractory
+        self.steps = 0
+
+        first, last = max(1, int(step_rate * 60 / bpm[1])), max(2, int(math.ceil(step_rate * 60 / bpm[0])))
+        self.first_lag, self.last_lag = first, last
+        self.lags = np.arange(first, last + 1)
+        # Кольцо превышений потока, записанное дважды подряд: значения lags шагов назад — один срез
+        self.size = last + 1
+        self.history = np.zeros(2 * self.size)
+        self.acf = np.zeros(len(self.lags))
+        self.energy = 0.0  # Автокорреляция на нулевом лаге
+        self.forget = math.exp(-1.0 / max(memory * step_rate, 1.0))
+        tempi = 60.0 * step_rate / self.lags
+        self.prior = np.exp(-0.5 * (np.log2(tempi / prefer) / 0.5) ** 2)
+        self.tempo = 0.0
+        self.confidence = 0.0
+        self._past = np.zeros(len(self.lags))
+        self._score = np.zeros(len(self.lags))
+
+    def matches(self, shape, step_rate):
+        return self.shape == tuple(shape) and self.step_rate == step_rate
+
+    def update(self, raw):
+        # True, если на этом шаге доля
+        np.subtract(raw, self.previous, out=self._delta)
+        np.maximum(self._delta, 0.0, out=self._delta)
+        np.copyto(self.previous, raw)
+        flux = float(self._delta.sum())
+        self.flux = flux
+        threshold = self.mean + self.sensitivity * self.deviation
+        excess = max(flux - self.mean, 0.0)
+        onset = self.steps > 1 and flux > threshold and excess > 0.0 and self.since >= self.refractory
+        self.since = 0 if onset else self.since + 1
+        if onset:
+            self.onsets += 1
+            self.strength = excess / self.deviation if self.deviation else 0.0
+        self.deviation += self.alpha * (abs(flux - self.mean) - self.deviation)
+        self.mean += self.alpha * (flux - self.mean)
+
+        # Автокорреляция превышений: новое значение умножается на значения lags шагов назад.
+        # Без превышения автокорреляция только затухает целиком, и её максимум не меняется
+        position = self.steps % self.size + self.size
+        self.history[position] = self.history[position - self.size] = excess
+        self.steps += 1
+        self.acf *= self.forget
+        self.energy = self.energy * self.forget + excess * excess
+        if excess > 0.0:
+            past = self.history[position - self.last_lag:position - self.first_lag + 1]
+            np.multiply(past[::-1], excess, out=self._past)
+            self.acf += self._past
+            np.multiply(self.acf, self.prior, out=self._score)
+            best = int(self._score.argmax())
+            self.confidence = float(self.acf[best] / self.energy)
+            self.tempo = 60.0 * self.step_rate / self._refine(best)
+        return onset
+
+    def _refine(self, best):
+        # Параболическая интерполяция максимума между соседними лагами
+        lag = float(self.lags[best])
+        if 0 < best < len(self.acf) - 1:
+            left, centre, right = self.acf[best - 1], self.acf[best], self.acf[best + 1]
+            curvature = left - 2 * centre + right
+            if curvature < 0:
+                lag += 0.5 * (left - right) / curvature
+        return lag